@@ -11,22 +11,33 @@ from math import ceil
 
 class Controller:
 
-    def __init__(self, Nb=4):
+    def __init__(self, Nb=4, T_tempo_MIN=1, delta_tempo_max=0.3, epsilon_t=0.01):
+        '''
+        Create new Controller.
+        Either initialise with default parameters or set your own.
+
+        Parameters
+        ----------
+        Nb: number of beats per bar.
+        T_tempo_MIN: minimum time between machine tempo changes [seconds].
+        delta_tempo_max: max tempo slope used to catch up with the perceptual beat.
+        epsilon_t: acceptable time error [seconds].
+        '''
         # initialise user parameters
         self.Nb = Nb
 
         # 1. Max tempo change rate
-        self.T_tempo_MIN = 1
+        self.T_tempo_MIN = T_tempo_MIN
 
         # 2. Max tempo slope
         # delta_BP_sync = 0.1 # [beats]
         # delta_t_sync = 2 # [seconds]
         # self.delta_tempo_max = delta_BP_sync/delta_t_sync
-        self.delta_tempo_max = 0.0005
+        self.delta_tempo_max = delta_tempo_max    # returned by __deltaTempoMax()
     
         # 3. Acceptable BP error
         # acceptable time error
-        self.epsilon_t = 0.01 # [seconds]
+        self.epsilon_t = epsilon_t # [seconds]
 
         # 4. Arrays for stats
         self.BP_errors = []     # array of BP errors at each tempo change
@@ -82,17 +93,15 @@ class Controller:
         BP_error = MBD.getBeatPosition(t_tempo) - IBD.getBeatPosition(t_tempo)
         self.BP_errors.append(BP_error)
         # TODO: determine an appropriate delta_tempo_max based on how out of sync the machine is
-        self.delta_tempo_max = self.__deltaTempoMax(BP_error)
+        delta_tempo_max = self.__deltaTempoMax(BP_error)
 
         if abs(BP_error) <= tempo_p*self.epsilon_t:
             tempo_m_NEW = tempo_p   # machine is close enough to perceptual beat, therefore match perceptual tempo
             return tempo_m_NEW
         elif BP_error > 0:
             # Machine is ahead -> slow down
-            delta_tempo_max = -self.delta_tempo_max    # machine tempo must be greater than perceptual tempo
-        else:
-            # Machine is behind -> speed up
-            delta_tempo_max = self.delta_tempo_max  # machine tempo must be greater than perceptual tempo
+            delta_tempo_max = -delta_tempo_max    # machine tempo must be less than perceptual tempo
+        # else machine is behind -> speed up: machine tempo must be greater than perceptual tempo
 
         # 2. Find minimum interception time given control parameter delta_tempo_max
         t_int_MIN = (BP_p0 - BP_m0 + (tempo_p - tempo_m + delta_tempo_max)*t_tempo)/delta_tempo_max
@@ -109,7 +118,7 @@ class Controller:
         '''
         Returns the appropriate max tempo slope for the given BP error
         '''
-        return 0.3
+        return self.delta_tempo_max
         
         BP_error = abs(BP_error)
 
@@ -8,31 +8,51 @@ Created on Sun Oct 18 11:31:07 2020
 
 import numpy as np
 from math import ceil
+from WeightedLineFit import WeightedLineFit
+from RingBuffer import RingBuffer
+from OnsetWeighting import OnsetWeighting
 
 class InputBeatDetector:
     
-    def __init__(self, Nb=4, beat_div=2, BP_window=5):
+    def __init__(self, Nb=4, beat_div=2, BP_window=5, kick_weight=3, snare_weight=0.5, history_length=8192,
+                 weighting_profile=None):
         '''
         Create new InputBeatDetector.
         Either initialise with default parameters or set your own.
+        kick_weight and snare_weight multiply the weighting of kick and all
+        other onsets in the line of best fit. weighting_profile (a dict or
+        the path of a JSON file, see OnsetWeighting) sets the weighting of
+        each bar position and note class instead.
+
+        Only the most recent [history_length] values of each history (onsets,
+        estimates and predictions) are kept, so memory use does not grow
+        with the length of the session.
         '''
         self.Nb = Nb
         self.beat_div=beat_div
         
         # IBD parameters
         self.BP_window = BP_window      # onsets within last [BP_window] beats considered.
-        self.t_ons = []
-        self.BP_ons = []
+        self.t_ons = RingBuffer(history_length)
+        self.BP_ons = RingBuffer(history_length)
         self.n = 0   # number of onsets received.
-        self.tempo = []   # tempo (in bps) estimations
-        self.BP_0 = []      # BP intercept estimations
-        self.BP_next_beat = []      # predicted BP of next beat made at each onset
-        self.t_next_beat = []       # predicted times of next beat made at each onset
+        self.tempo = RingBuffer(history_length)   # tempo (in bps) estimations
+        self.BP_0 = RingBuffer(history_length)      # BP intercept estimations
+        self.BP_next_beat = RingBuffer(history_length, dtype=np.int64)      # predicted BP of next beat made at each onset
+        self.t_next_beat = RingBuffer(history_length)       # predicted times of next beat made at each onset
         self.BP_BBP1 = 1
-        self.W = []
+        self.W = RingBuffer(history_length)
+        self.line_fit = WeightedLineFit()     # weighted line of best fit through onsets in window
+        self.n_descent = 0      # index of the last onset at a lower BP than the onset before it
         
-        self.kick_weight = 3
-        self.snare_weight = 0.5
+        self.kick_weight = kick_weight
+        self.snare_weight = snare_weight
+        self.onset_weighting = OnsetWeighting(Nb, beat_div, kick_weight, snare_weight, weighting_profile)
+        # weighting tables (see OnsetWeighting.weight)
+        self.N_positions = Nb*beat_div
+        self.weight_scale = self.onset_weighting.scale
+        self.weight_offset = self.onset_weighting.offset
+        self.note_weights = self.onset_weighting.note_weights
         
     def onset(self, tOns, note=36):
         '''
@@ -63,6 +83,7 @@ class InputBeatDetector:
             
             # Decide on weighting
             self.W.append(1)
+            self.line_fit.add(self.t_ons[-1], self.BP_ons[-1], self.W[-1])
 
         else:       # True if second onset or later
             if self.n == 1:
@@ -75,14 +96,16 @@ class InputBeatDetector:
                 # onset is third or later
                 # therefore, quantise based on new BP estimate
                 self.t_ons.append(tOns)
-                BP_ons, acc = self.__beatPositionQuantised(tOns)
+                BP_ons, acc = self.beatPositionQuantised(tOns, self.tempo[-1], self.BP_0[-1])
                 self.BP_ons.append(BP_ons)
             
             # Decide on weighting
-            self.W.append(self.__weighting(note,acc))
+            self.W.append(self.weighting(note, acc, self.BP_ons[-1]))
+            self.line_fit.add(self.t_ons[-1], self.BP_ons[-1], self.W[-1])
             
             # Plot a line of best fit through onsets within window
-            tempo_new, BP_0_new = self.__lineOfBestFit()
+            history = lambda: (self.t_ons.view(), self.BP_ons.view(), self.W.view())
+            tempo_new, BP_0_new = self.__lineOfBestFit(self.n, self.t_ons[-1], self.BP_ons[-1], self.tempo[-1], history)
             
             self.tempo.append(tempo_new)
             self.BP_0.append(BP_0_new)
@@ -98,103 +121,152 @@ class InputBeatDetector:
         
         self.n = self.n + 1     # increment number of onsets recorded
     
-    def __weighting(self, note, accuracy):
-        '''
-        Returns weighting parameter given note type (kick or snare) and Bar Beat Position
+    def onsets(self, t_ons, notes):
         '''
-        w = accuracy
-        
-        bsbp = self.getBarSubBeatPositionofLastOnset()
-        #print(bsbp)
-        # if on the beat, weight higher
-        if self.Nb == 4:
-            if bsbp in [1,5,9,13]:
-                w = w*2
-            elif bsbp in [3,7,11,15]:
-                w = w*0.8
-            else:
-                w = 0.1
-        elif self.Nb == 3:
-            if bsbp in [1,4,7,10]:
-                w = w*2.5
-            else:
-                w = w*0.5
-        elif self.Nb == 2:
-            if bsbp in [1,3,5,7]:
-                w = w*2
+        Offline equivalent of calling onset() for each onset in turn, for a
+        whole recording at once. The histories and predictions are the same
+        as those of the streaming path.
+
+        Each onset's beat position depends on the estimate made at the onset
+        before it, so the estimates are made in one loop over preallocated
+        arrays. Predictions and histories are then computed and stored for
+        all onsets at once.
+
+        Parameters
+        ----------
+        t_ons : array of onset times (latency corrected).
+        notes : array of MIDI note numbers of the onsets.
+        '''
+        t_ons = np.asarray(t_ons, dtype=np.float64)
+        notes = np.asarray(notes)
+        N = len(t_ons)
+        if N == 0:
+            return
+
+        # 1. Beat position, weighting and perceptual beat estimate at each onset
+        BP_ons = np.empty(N)
+        W = np.empty(N)
+        tempo = np.empty(N)
+        BP_0 = np.empty(N)
+        tempo_last = self.tempo[-1] if self.n > 0 else -1
+        BP_0_last = self.BP_0[-1] if self.n > 0 else -1
+        line_fit = self.line_fit
+        for i, t in enumerate(t_ons.tolist()):
+            n = self.n + i
+            if n == 0:   # True if first onset
+                BP = 1   # we assume first onset is at BP = 1
+                self.BP_BBP1 = 1
+                w = 1
+                line_fit.add(t, BP, w)
+                tempo_last = -1
+                BP_0_last = BP
             else:
-                pass
+                if n == 1:
+                    BP = 2  # second onset is assumed to be at BP 2
+                    acc = 1
+                else:
+                    BP, acc = self.beatPositionQuantised(t, tempo_last, BP_0_last)
+                w = self.weighting(notes[i], acc, BP)
+                line_fit.add(t, BP, w)
+                BP_ons[i] = BP
+                W[i] = w
+                history = lambda i=i: (np.concatenate((self.t_ons.view(), t_ons[:i+1])),
+                                       np.concatenate((self.BP_ons.view(), BP_ons[:i+1])),
+                                       np.concatenate((self.W.view(), W[:i+1])))
+                tempo_last, BP_0_last = self.__lineOfBestFit(n, t, BP, tempo_last, history)
+            BP_ons[i] = BP
+            W[i] = w
+            tempo[i] = tempo_last
+            BP_0[i] = BP_0_last
 
-        
-        if note==36:    # kick
-            w = w*self.kick_weight
-        else:
-            w = w*self.snare_weight
-            
-        return w
+        # 2. Predictions of next beat made at each onset
+        on_beat = np.floor(BP_ons) == BP_ons
+        BP_next = np.where(on_beat, BP_ons + 1, np.ceil(BP_ons))
+        t_next = 1/tempo*(BP_next - BP_0)
+        if self.n == 0:
+            # no estimate of perceptual BP yet at the first onset
+            BP_next[0] = -1
+            t_next[0] = -1
+
+        # 3. Store. The first onset adds one estimate to the histories, later
+        # onsets add the same estimate twice (as onset() does)
+        repeats = np.full(N, 2)
+        if self.n == 0:
+            repeats[0] = 1
+        self.t_ons.extend(t_ons)
+        self.BP_ons.extend(BP_ons)
+        self.W.extend(W)
+        self.tempo.extend(np.repeat(tempo, repeats))
+        self.BP_0.extend(np.repeat(BP_0, repeats))
+        self.t_next_beat.extend(t_next)
+        self.BP_next_beat.extend(BP_next.astype(np.int64))
+        self.n = self.n + N
+
+    def weighting(self, note, accuracy, BP_ons):
+        '''
+        Returns weighting parameter given the MIDI note and Bar Sub Beat Position
+        of an onset at beat position BP_ons, looked up in the weighting tables
+        '''
+        # index of the nearest sub beat of the bar (0 is the first beat)
+        position = round((BP_ons-self.BP_BBP1)%self.Nb*self.beat_div)%self.N_positions
+        return (accuracy*self.weight_scale[position] + self.weight_offset[position])*self.note_weights[note]
         
         
         
     
-    def __lineOfBestFit(self):
+    def __lineOfBestFit(self, n, t_ons, BP_ons, tempo, history):
         '''
         Returns values of m and b for the equation of a line of best fit
-        through the onsets
-        '''
-        # 1. make a list containing all onsets within evaluation window
-        i_window = 0
-        BP_current = self.BP_ons[-1]
-        for i in range(self.n-1, -1, -1):
-            if BP_current-self.BP_ons[i] > self.BP_window:
-                i_window = i
-                break # onset is outside of window. 
-        x = np.array(self.t_ons[i_window:])
-        y = np.array(self.BP_ons[i_window:])
-        w = np.array(self.W[i_window:])
-
-        # check if list has only one value
-        if len(x) == 1:
+        through the onsets, after the newest onset n (at t_ons, BP_ons) has
+        been added. tempo is the previous tempo estimate. history() returns
+        arrays of the time, BP and weighting of the onsets kept (newest last).
+
+        The window is the onsets from the newest one more than BP_window
+        below BP_ons. This is exact while the onsets it would scan back to
+        are still in the history (the last history_length onsets).
+        '''
+        # 1. update the onsets within the evaluation window
+        if BP_ons < self.line_fit.y[-2]:
+            self.n_descent = n
+        n_oldest = n + 1 - len(self.line_fit)   # index of the oldest onset in the window
+        if self.n_descent <= n_oldest:
+            # BPs within the window never go back, so the onsets that have
+            # fallen out of it are the oldest: evict them
+            self.line_fit.evictOutsideWindow(BP_ons, self.BP_window)
+        else:
+            # BP has gone back within the window, so onsets evicted before may
+            # be within it again. Scan back from the newest onset to the first
+            # onset outside of the window and refit from there.
+            t_hist, BP_hist, W_hist = history()
+            self.line_fit.refitWindow(t_hist, BP_hist, W_hist, BP_ons, self.BP_window)
+
+        # check if window has only one value
+        if len(self.line_fit) == 1:
             # list is empty indicating no onsets within window
             # this could happen if input (e.g drummer) hasn't played in
             # a while. Therefore, we change the BP but not the tempo
-            tempo_new = self.tempo[-1]  # keep tempo the same
-            BP_0_new = self.BP_ons[-1] - tempo_new*self.t_ons[-1]
+            tempo_new = tempo  # keep tempo the same
+            BP_0_new = BP_ons - tempo_new*t_ons
         else:
-            # Calculate line of best fit, changing tempo and BP
-            
-            # set weights
-            #w = np.ones(len(x)) # TODO: improve weighting function if necessary
-            
-            n=sum(w)
-
-            sum_x = sum(w*x)
-            sum_x_2 = sum(w*x**2)
-            sum_y = sum(w*y)
-            sum_xy = sum(w*x*y)
-
-            # n = len(x)
-            # sum_x = np.sum(x)
-            # sum_x_2 = np.sum(x**2)
-            # sum_y = np.sum(y)
-            # sum_xy = np.sum(x*y)
-            
-            tempo_new = (n*sum_xy-sum_x*sum_y)/(n*sum_x_2-sum_x**2)
-            BP_0_new = (sum_y - tempo_new*sum_x)/n
+            # Calculate line of best fit, changing tempo and BP.
+            # The running sums of the fit are updated as onsets enter and
+            # leave the window, so this is constant time per onset.
+            tempo_new, BP_0_new = self.line_fit.line()
         
         # return new tempo and BP estimate
         return tempo_new, BP_0_new
         
     
-    def __beatPositionQuantised(self, tOns):
+    def beatPositionQuantised(self, tOns, tempo, BP_0):
         '''
         Returns the quantised beat position at tOns given
-        the IBD's new estimate of perceptual beat.
+        the IBD's estimate of perceptual beat (tempo, BP_0).
         
         Also returns accuracy as a percentage
         '''
         
         # Calculate the BP at tOns - given IBD's estimate
-        BP_ons_est = self.tempo[-1]*tOns + self.BP_0[-1]
+        BP_ons_est = tempo*tOns + BP_0
         
         # Calculate the BP of the nearest sub beat
         BP_ons_Q = round((BP_ons_est-int(BP_ons_est))*self.beat_div)*1/self.beat_div + int(BP_ons_est) 
@@ -337,14 +409,17 @@ class InputBeatDetector:
         '''
         Resets all IBD parameters
         '''
-        self.t_ons = []
-        self.BP_ons = []
+        self.t_ons.clear()
+        self.BP_ons.clear()
         self.n = 0   # count of number of onsets recorded.
-        self.tempo = []   # tempo (in bps) estimations
-        self.BP_0 = []      # BP intercept estimations
-        self.BP_next_beat = []      # predicted BP of next beat made at each onset
-        self.t_next_beat = []       # predicted times of next beat made at each onset
+        self.tempo.clear()   # tempo (in bps) estimations
+        self.BP_0.clear()      # BP intercept estimations
+        self.BP_next_beat.clear()      # predicted BP of next beat made at each onset
+        self.t_next_beat.clear()       # predicted times of next beat made at each onset
         self.BP_BBP1 = 1
+        self.W.clear()
+        self.line_fit.clear()
+        self.n_descent = 0
         
 
     def getOnsets(self):
@@ -355,7 +430,7 @@ class InputBeatDetector:
         -------
         t_ons[], BP_ons[]
         '''
-        return self.t_ons, self.BP_ons
+        return self.t_ons.view(), self.BP_ons.view()
     
     def getEstimates(self):
         '''
@@ -366,7 +441,7 @@ class InputBeatDetector:
         -------
         tempo[], BP_0[]
         '''
-        return self.tempo, self.BP_0
+        return self.tempo.view(), self.BP_0.view()
     
     def getPredictions(self):
         '''
@@ -377,4 +452,4 @@ class InputBeatDetector:
         -------
         t_next_beat[], BP_next_beat[]
         '''
-        return self.t_next_beat, self.BP_next_beat
\ No newline at end of file
+        return self.t_next_beat.view(), self.BP_next_beat.view()
\ No newline at end of file
@@ -0,0 +1,161 @@
+'''
+Latency Profiler - timing of each stage of the BeatSync control path
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import numpy as np
+from timeit import default_timer as timer
+from RingBuffer import RingBuffer
+
+# stages of the control path that are timed (all in seconds)
+STAGES = (
+    'receive_to_IBD',    # MIDI message stamped -> IBD.onset called
+    'IBD.onset',         # duration of IBD.onset
+    'MBD.onset',         # duration of MBD.onset
+    'controller.sample', # duration of Controller.sample
+    'send',              # duration of sending a MIDI message to MainStage
+    'loop_period',       # time between successive transport updates (main loop iterations)
+    'sample_overshoot',  # controller sampled this late after its deadline
+    'tempo_overshoot',   # tempo change sent this late after t_tempo_NEXT - tau_c_delay
+    'start_overshoot',   # start sent this late after t_send_start - delta_start
+)
+
+# histogram bin edges [s]: 1 us to 100 ms, 10 bins per decade
+HISTOGRAM_BINS = np.logspace(-6, -1, 51)
+
+class LatencyProfiler:
+    '''
+    Records how long each stage of the control path takes (see STAGES).
+
+    The profiler is attached to a Transport by wrapping its methods (and
+    those of the IBD, MBD and controller it creates) with timed versions.
+    A transport that has no profiler attached runs its original code, so
+    profiling costs nothing when it is switched off.
+
+    Timings are stored in preallocated ring buffers, one per stage.
+    '''
+
+    def __init__(self, history_length=8192):
+        '''
+        Create new LatencyProfiler.
+        The last [history_length] timings of each stage are kept.
+        '''
+        self.timings = {stage: RingBuffer(history_length) for stage in STAGES}
+        self.t_start = 0    # absolute time of the start of the test
+        self.t_last_update = None
+
+    def attach(self, transport):
+        '''
+        Wraps the methods of the transport (and of its detectors and
+        controller, each time they are recreated by reset()) with timed versions.
+        '''
+        inputOnset = transport.inputOnset
+        update = transport.update
+        reset = transport.reset
+        send = transport.send
+        timings = self.timings
+
+        def timedInputOnset(t, note):
+            timings['receive_to_IBD'].append(timer() - (self.t_start + t))
+            inputOnset(t, note)
+
+        def timedSend(msg):
+            t0 = timer()
+            send(msg)
+            timings['send'].append(timer() - t0)
+
+        def timedUpdate(t):
+            # 1. Loop iteration period
+            t_now = timer()
+            if self.t_last_update is not None:
+                timings['loop_period'].append(t_now - self.t_last_update)
+            self.t_last_update = t_now
+
+            # 2. Deadline overshoot of whatever this update does
+            controller_on = transport.controller_on
+            controller_set = transport.controller_set
+            t_tempo_NEXT = transport.t_tempo_NEXT
+            start_scheduled = transport.start_scheduled
+            t_send_start = transport.t_send_start
+            update(t)
+            if controller_on and transport.t_tempo_NEXT != t_tempo_NEXT:
+                timings['tempo_overshoot'].append(t - (t_tempo_NEXT - transport.tau_c_delay))
+            elif controller_on and not controller_set and transport.controller_set:
+                timings['sample_overshoot'].append(t - (t_tempo_NEXT - transport.tau_c_exec - transport.tau_c_delay))
+            if start_scheduled and not transport.start_scheduled:
+                timings['start_overshoot'].append(t - (t_send_start - transport.delta_start))
+
+        def timedReset(*args, **kwargs):
+            reset(*args, **kwargs)
+            self.__wrapObjects(transport)
+
+        transport.inputOnset = timedInputOnset
+        transport.send = timedSend
+        transport.update = timedUpdate
+        transport.reset = timedReset
+        self.__wrapObjects(transport)
+
+    def __wrapObjects(self, transport):
+        '''
+        Wraps the methods of the IBD, MBD and controller of the transport
+        '''
+        transport.IBD.onset = self.__timed(transport.IBD.onset, self.timings['IBD.onset'])
+        transport.MBD.onset = self.__timed(transport.MBD.onset, self.timings['MBD.onset'])
+        transport.controller.sample = self.__timed(transport.controller.sample, self.timings['controller.sample'])
+
+    def __timed(self, function, timings):
+        '''
+        Returns a version of function that appends its duration to timings
+        '''
+        def timedFunction(*args, **kwargs):
+            t0 = timer()
+            result = function(*args, **kwargs)
+            timings.append(timer() - t0)
+            return result
+        return timedFunction
+
+    def startTest(self, t_start):
+        '''
+        Clears all timings. t_start is the absolute time (timeit.default_timer)
+        that transport times are measured from.
+        '''
+        self.t_start = t_start
+        self.t_last_update = None
+        for timings in self.timings.values():
+            timings.clear()
+
+    def getTimings(self):
+        '''
+        Returns a dict of arrays of the timings [s] recorded for each stage
+        '''
+        return {stage: np.array(timings.view()) for stage, timings in self.timings.items()}
+
+
+def latencyStats(timings):
+    '''
+    Returns a dict of (count, mean, p50, p99, max) in seconds for each stage
+    of timings (as returned by LatencyProfiler.getTimings()).
+    '''
+    stats = {}
+    for stage, values in timings.items():
+        if len(values) == 0:
+            stats[stage] = (0, np.nan, np.nan, np.nan, np.nan)
+        else:
+            stats[stage] = (len(values), np.mean(values), np.percentile(values, 50),
+                np.percentile(values, 99), np.max(values))
+    return stats
+
+def latencyReport(timings, prefix):
+    '''
+    Saves the timings of a test, their histograms (see HISTOGRAM_BINS) and a
+    summary table to [prefix]latency.npz and [prefix]latency.txt.
+    '''
+    histograms = {stage + '_histogram': np.histogram(values, HISTOGRAM_BINS)[0] for stage, values in timings.items()}
+    np.savez(prefix + 'latency.npz', bins=HISTOGRAM_BINS, **timings, **histograms)
+
+    with open(prefix + 'latency.txt', 'w') as textfile:
+        textfile.write(f'{"stage":<20}{"count":>8}{"mean [us]":>12}{"p50 [us]":>12}{"p99 [us]":>12}{"max [us]":>12}\n')
+        for stage, (count, mean, p50, p99, maximum) in latencyStats(timings).items():
+            textfile.write(f'{stage:<20}{count:>8}{1e6*mean:>12.1f}{1e6*p50:>12.1f}{1e6*p99:>12.1f}{1e6*maximum:>12.1f}\n')
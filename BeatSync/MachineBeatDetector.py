@@ -6,13 +6,20 @@ Machine Beat Detector
 '''
 
 import numpy as np
+from math import ceil
+from RingBuffer import RingBuffer
+from WeightedLineFit import WeightedLineFit
 
 class MachineBeatDetector:
 
-    def __init__(self, Nb=4, beat_div=2, tempo_init=-1):
+    def __init__(self, Nb=4, beat_div=2, tempo_init=-1, history_length=8192):
         '''
         Create new MachineBeatDetector.
         Either initialise with default parameters or set your own.
+
+        Only the most recent [history_length] values of each history are kept
+        (but always enough onsets to fill the window), so memory use does not
+        grow with the length of the session.
         '''
         self.Nb = Nb    # Num beats per bar
         self.beat_div = beat_div # beat division
@@ -26,14 +33,19 @@ class MachineBeatDetector:
         self.knownTempo = -1  # becomes greater than 0 once tempo change is made
         self.i_w_MIN = -1    # index of lower window limit. Set whenever tempo change received.
         self.isAlreadyShifted = False # becomes True when controller initiates shift
-
-        # intialise lists
-        self.t_ons = []
-        self.BP_ons = []
-        self.tempo = []
-        self.BP_0 = []
-        self.t_beats = []  # list of machine beat times (beats occur when BP is an integer)
-        self.tempo_change_indices = []  # array of indices of onsets representing a tempo change
+        self.BP_offset = 0  # total shift of beat position (added to BP_ons and BP_0 when read)
+
+        # intialise histories
+        # (BP_ons and BP_0 are stored unshifted)
+        # (the window can hold one onset beyond BP_window, plus the newest onset)
+        history_length = max(history_length, int(ceil(self.BP_window*self.beat_div)) + 2)
+        self.t_ons = RingBuffer(history_length)
+        self.BP_ons = RingBuffer(history_length)
+        self.tempo = RingBuffer(history_length)
+        self.BP_0 = RingBuffer(history_length)
+        self.t_beats = RingBuffer(history_length)  # machine beat times (beats occur when BP is an integer)
+        self.is_tempo_change = RingBuffer(history_length, dtype=np.bool_)  # True for each onset representing a tempo change
+        self.line_fit = WeightedLineFit()   # onsets within window (all weighted equally)
 
     def onset(self, tOns, BBP_ons):
         if self.n > 0:     # True if 2nd or later onset
@@ -42,8 +54,14 @@ class MachineBeatDetector:
             # higher than the previous machine onset.
             self.BP_ons.append(self.BP_ons[-1]+1/self.beat_div)
             self.t_ons.append(tOns)
+            self.is_tempo_change.append(False)
             self.n = self.n + 1
 
+            if self.n-1 == self.i_w_MIN:
+                # first onset since tempo change -> window starts at this onset
+                self.line_fit.clear()
+            self.line_fit.add(self.t_ons[-1], self.BP_ons[-1])
+
             if self.TempoDefinite:
                 # Plot line of best fit to calculate the machine beat position
                 # - tempo is calculated based on the intervals of the onsets.
@@ -59,14 +77,17 @@ class MachineBeatDetector:
             # first onset
             self.t_ons.append(tOns)
             self.BP_ons.append(BBP_ons)
+            self.is_tempo_change.append(False)
 
             self.tempo.append(self.tempo_INIT)  # Assume tempo is the initial tempo
             self.BP_0.append(BBP_ons - self.tempo_INIT*tOns)
+            self.line_fit.add(self.t_ons[-1], self.BP_ons[-1])
 
             self.n = self.n + 1   # increment n
         
         # Finally, if onset is an integer, we store it to keep track of machine beat times
-        if self.BP_ons[-1] - int(self.BP_ons[-1]) < 0.00001:
+        BP = self.BP_ons[-1] + self.BP_offset
+        if BP - int(BP) < 0.00001:
             self.t_beats.append(self.t_ons[-1])
     
     def tempoChange(self, t_tempo, tempo_m_new):
@@ -107,7 +128,7 @@ class MachineBeatDetector:
             #     # process tempo change as if it were an onset
             # self.BP_ons.append(BP_ons_est)
             # self.t_ons.append(t_tempo)
-            # self.tempo_change_indices.append(self.n)
+            # self.is_tempo_change.append(True)
 
             # # 2. Set tempo_m and BP_m0
             # self.tempo.append(tempo_m_new)
@@ -133,13 +154,15 @@ class MachineBeatDetector:
         self.knownTempo = -1  # becomes greater than 0 once tempo change is made
         self.i_w_MIN = -1    # index of lower window limit. Set whenever tempo change received.
         self.isAlreadyShifted = False # becomes True when controller initiates shift
-
-        # intialise lists
-        self.t_ons = []
-        self.BP_ons = []
-        self.tempo = []
-        self.BP_0 = []
-        self.tempo_change_indices = []  # array of indices of onsets representing a tempo change
+        self.BP_offset = 0
+
+        # clear histories
+        self.t_ons.clear()
+        self.BP_ons.clear()
+        self.tempo.clear()
+        self.BP_0.clear()
+        self.is_tempo_change.clear()
+        self.line_fit.clear()
                 
     
     
@@ -152,24 +175,24 @@ class MachineBeatDetector:
         If tempo_calc is False, just the y intercept is calculated.
         '''
         
-        # 1. make a list containing all onsets within evaluation window
-        i_window = 0
-        BP_current = self.BP_ons[-1]
-        for i in range(self.n-1, -1, -1):
-            if (i == self.i_w_MIN) or (BP_current-self.BP_ons[i] > self.BP_window):
-                i_window = i
-                break  # onset is outside of window
-        x = np.array(self.t_ons[i_window:])     # list of times
-        y = np.array(self.BP_ons[i_window:])    # list of BPs
+        # 1. evict onsets that have fallen out of the evaluation window.
+        # Onsets before the last tempo change (i_w_MIN) were removed from the
+        # window when the first onset after it was received.
+        # Beat positions are compared unshifted, so a shift does not change
+        # the window (shifted by a fraction, an onset exactly BP_window back
+        # could be rounded out of it).
+        self.line_fit.evictOutsideWindow(self.BP_ons[-1], self.BP_window)
         
         # 2. Calculate tempo as average of tempos within window
+        # (from the mean interval, equal to averaging the intervals within
+        # float rounding)
         if tempo_calc:  # True when tempo not definite
-            tempo_new = 1/(np.mean(x[1:] - x[0:-1])*self.beat_div)    # average tempo   
+            tempo_new = 1/(self.line_fit.meanInterval()*self.beat_div)    # average tempo   
         else:   # True when tempo is definite
             tempo_new = self.knownTempo  # set the tempo to the known machine tempo
          
         # 3. calculate the "y-intercept" to go through the centre of mass
-        BP_0_new = (np.sum(y) - tempo_new*np.sum(x))/len(x)
+        BP_0_new = self.line_fit.intercept(tempo_new)
         # return new tempo and BP estimate
         return tempo_new, BP_0_new
     
@@ -180,7 +203,7 @@ class MachineBeatDetector:
         if self.n == 0: # return -1 if no estimate of machine BP yet.
             return -1
 
-        return self.tempo[-1]*t + self.BP_0[-1]
+        return self.tempo[-1]*t + (self.BP_0[-1] + self.BP_offset)
 
 
     def getBarBeatPosition(self, t):
@@ -206,7 +229,7 @@ class MachineBeatDetector:
         if self.n == 0: # return -1 if no estimate of machine BP yet.
             return -1
 
-        BBP = ((self.BP_ons[-1]-self.BP_BBP1)%self.Nb) + 1
+        BBP = ((self.BP_ons[-1]+self.BP_offset-self.BP_BBP1)%self.Nb) + 1
         return BBP
 
     def getBeatPositionFunction(self):
@@ -221,7 +244,7 @@ class MachineBeatDetector:
         if self.n == 0: # return -1 if no estimate of machine BP yet.
             return -1, -1
 
-        return self.tempo[-1], self.BP_0[-1]
+        return self.tempo[-1], self.BP_0[-1] + self.BP_offset
     
     def getTempo(self):
         '''
@@ -244,14 +267,16 @@ class MachineBeatDetector:
         self.knownTempo = -1  # becomes greater than 0 once tempo change is made
         self.i_w_MIN = -1    # index of lower window limit. Set whenever tempo change received.
         self.isAlreadyShifted = False # becomes True when controller initiates shift
-
-        # intialise lists
-        self.t_ons = []
-        self.BP_ons = []
-        self.tempo = []
-        self.BP_0 = []
-        self.t_beats = []
-        self.tempo_change_indices = []  # array of indices of onsets representing a tempo change
+        self.BP_offset = 0
+
+        # clear histories
+        self.t_ons.clear()
+        self.BP_ons.clear()
+        self.tempo.clear()
+        self.BP_0.clear()
+        self.t_beats.clear()
+        self.is_tempo_change.clear()
+        self.line_fit.clear()
         
     
     def getOnsets(self, include_tempo_changes=True):
@@ -268,18 +293,11 @@ class MachineBeatDetector:
         '''
         
         if include_tempo_changes:   
-            return self.t_ons, self.BP_ons  # return arrays as they are, incl. tempo change onsets
+            return self.t_ons.view(), self.BP_ons.view() + self.BP_offset  # return arrays as they are, incl. tempo change onsets
         
         # otherwise, remove tempo changes from onset arrays and return
-        t_ons_output = []
-        BP_ons_output = []
-        for i in range(self.n):
-            if i in self.tempo_change_indices:
-                continue
-            t_ons_output.append(self.t_ons[i])
-            BP_ons_output.append(self.BP_ons[i])
-
-        return self.t_ons, self.BP_ons
+        is_onset = ~self.is_tempo_change.view()
+        return self.t_ons.view()[is_onset], self.BP_ons.view()[is_onset] + self.BP_offset
 
     
     def getTempoChangeOnsets(self):
@@ -290,15 +308,8 @@ class MachineBeatDetector:
         -------
         t_ons[], BP_ons[]
         '''
-
-        t_ons_output = []
-        BP_ons_output = []
-        for i in range(self.n):
-            if i in self.tempo_change_indices:
-                t_ons_output.append(self.t_ons[i])
-                BP_ons_output.append(self.BP_ons[i])
-            
-        return self.t_ons, self.BP_ons
+        is_tempo_change = self.is_tempo_change.view()
+        return self.t_ons.view()[is_tempo_change], self.BP_ons.view()[is_tempo_change] + self.BP_offset
     
     def getEstimates(self):
         '''
@@ -307,22 +318,24 @@ class MachineBeatDetector:
 
         Returns
         -------
-        tempo: list
-        BP_0: list
+        tempo: array
+        BP_0: array
         '''
-        return self.tempo, self.BP_0
+        return self.tempo.view(), self.BP_0.view() + self.BP_offset
 
     def shiftBeatPosition(self, BP_shift:float):
         '''
         Shift machine beat position by an integer amount, BP_shift.
         
         Usually performed by the BeatSyncController to position machine and perceptual BP within one bar relative to each other
+
+        The shift is added to an offset applied whenever a beat position is
+        read, so it takes constant time however long the history is.
         '''
 
         if BP_shift != 0:   # if shift required is 0, do nothing
             # shift the BP of each onset by the amount [BP_shift]
-            self.BP_ons = (np.array(self.BP_ons) + BP_shift).tolist()
-            self.BP_0 = (np.array(self.BP_0) + BP_shift).tolist()
+            self.BP_offset = self.BP_offset + BP_shift
             self.isAlreadyShifted = True
     
     def getBeatDivision(self):
@@ -333,11 +346,19 @@ class MachineBeatDetector:
     
     def getBeatTimes(self):
         '''
-        Returns a list of machine beat times.
+        Returns an array of machine beat times.
         Beats occur at integer values of Beat Position.
 
         Returns
         -------
-        t_beats: list
+        t_beats: array
+        '''
+        return self.t_beats.view()
+
+    def getFirstBeatIndex(self):
+        '''
+        Returns the index of the first beat time returned by getBeatTimes()
+        among all the machine beats since the MBD was reset. This is 0
+        unless more than history_length beats have been recorded.
         '''
-        return self.t_beats
\ No newline at end of file
+        return self.t_beats.dropped()
\ No newline at end of file
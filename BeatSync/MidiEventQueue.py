@@ -0,0 +1,70 @@
+'''
+MIDI Event Queue
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import queue
+from timeit import default_timer as timer
+from RingBuffer import RingBuffer
+
+class MidiEventQueue:
+    '''
+    Queue of MIDI messages received on one or more input ports.
+
+    Ports are opened with a callback from listener(), so messages are pushed
+    onto the queue by mido's receive thread. The main loop can then sleep in
+    get() until a message arrives or a deadline passes, instead of polling.
+
+    Each message is timestamped in the callback, as soon as it is received,
+    so onset times do not depend on when the main loop gets round to it.
+    The delay between stamping and the main loop taking the message off the
+    queue is recorded for each message.
+    '''
+
+    def __init__(self, history_length=8192):
+        '''
+        Create new, empty MidiEventQueue.
+        The delays of the last [history_length] messages are kept.
+        '''
+        self.queue = queue.SimpleQueue()
+        self.delays = RingBuffer(history_length)   # stamping to processing delays in seconds
+
+    def listener(self, port_id):
+        '''
+        Returns a callback to pass to mido.open_input(). Each message received
+        on the port is stamped with the time of reception and added to the
+        queue as (port_id, t, msg).
+        '''
+        def callback(msg):
+            self.queue.put((port_id, timer(), msg))
+        return callback
+
+    def get(self, timeout=None):
+        '''
+        Returns the oldest (port_id, t, msg) event, waiting up to timeout
+        seconds for one to arrive. Waits indefinitely if timeout is None.
+        t is the time (from timeit.default_timer) the message was received.
+
+        Returns None if no event arrived before the timeout.
+        '''
+        try:
+            event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.delays.append(timer() - event[1])
+        return event
+
+    def getDelays(self):
+        '''
+        Returns an array of the delays in seconds between each message being
+        stamped and being taken off the queue.
+        '''
+        return self.delays.view()
+
+    def resetDelays(self):
+        '''
+        Clears the record of stamping to processing delays
+        '''
+        self.delays.clear()
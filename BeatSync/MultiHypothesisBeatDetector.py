@@ -0,0 +1,252 @@
+'''
+Multi Hypothesis Beat Detector
+
+@author: Ben Adey
+@year: 2020
+'''
+
+from math import log
+from collections import deque
+from WeightedLineFit import WeightedLineFit
+from InputBeatDetector import InputBeatDetector
+
+class _Hypothesis:
+    '''
+    One tempo/phase hypothesis: the beat position given to the onsets so far
+    and the weighted line of best fit through those within the window.
+    '''
+
+    def __init__(self, line_fit, history, tempo, BP_0, BP_ons, score=0, w=1, n_descent=0):
+        self.line_fit = line_fit
+        self.history = history  # deques of the time, BP and weighting of the last onsets (newest last)
+        self.tempo = tempo      # [bps], -1 until the second onset
+        self.BP_0 = BP_0
+        self.BP_ons = BP_ons    # beat position of the last onset
+        self.score = score
+        self.w = w              # weighting of the last onset
+        self.n_descent = n_descent  # index of the last onset at a lower BP than the onset before it
+
+    def copy(self):
+        return _Hypothesis(self.line_fit.copy(), tuple(values.copy() for values in self.history), self.tempo,
+                           self.BP_0, self.BP_ons, self.score, self.w, self.n_descent)
+
+
+class MultiHypothesisBeatDetector(InputBeatDetector):
+    '''
+    Input beat detector that follows a beam of competing tempo/phase
+    hypotheses instead of a single quantisation path.
+
+    The InputBeatDetector assumes the first onset is at BP 1 and the second
+    at BP 2, so an early onset on an off beat (or a sub beat apart) locks it
+    onto the wrong phase or a multiple of the tempo. Here the first onset
+    may be on any sub beat of the bar and the second any number of sub beats
+    (up to two beats) after it. From the third onset, each hypothesis
+    quantises, weights and fits the onset exactly as the InputBeatDetector
+    does, with its own line fit and history of onsets (refitting from the
+    history when the BP goes back within the window).
+
+    The first two onsets are not quantised, so they are not scored: each
+    hypothesis starts with a prior score, 0 for the InputBeatDetector's
+    assumption and less for any other phase or interval. From the third
+    onset, each onset adds its weighting to the score of a hypothesis, less
+    a cost for its quantisation error and for every beat since the last
+    onset, so a faster tempo has to earn its extra beats. Scores decay, so
+    an old mistake is forgotten. After every onset, hypotheses that have converged
+    (same bar phase and tempo) are merged and only the [beam_width] best are
+    kept, so each onset costs O(beam_width).
+
+    The best hypothesis is the estimate: its beat position, tempo and BP_0
+    are recorded in the histories, so every getter of the InputBeatDetector
+    (getBeatPositionFunction, getPredictions...) returns the best hypothesis.
+    '''
+
+    def __init__(self, Nb=4, beat_div=2, BP_window=5, kick_weight=3, snare_weight=0.5, history_length=8192,
+                 weighting_profile=None, beam_width=16, tempo_MIN=40, tempo_MAX=240, beat_cost=2, error_cost=6, decay=0.99, switch_margin=12,
+                 phase_cost=1, interval_cost=1):
+        '''
+        Create new MultiHypothesisBeatDetector. The first parameters are
+        those of the InputBeatDetector.
+
+        Parameters
+        ----------
+        beam_width: maximum number of hypotheses kept after each onset.
+        tempo_MIN, tempo_MAX: range of tempo of a hypothesis [BPM].
+        beat_cost: score cost of each beat between onsets.
+        error_cost: score cost of an onset halfway between sub beats
+            (scaled by 1 - accuracy).
+        decay: factor the score is multiplied by at each onset.
+        switch_margin: score by which a hypothesis must beat the current
+            best to replace it.
+        phase_cost: prior score cost of a first onset that is not on the
+            first beat of the bar.
+        interval_cost: prior score cost of a second onset that is not one
+            beat after the first.
+        '''
+        InputBeatDetector.__init__(self, Nb, beat_div, BP_window, kick_weight, snare_weight, history_length, weighting_profile)
+        self.beam_width = beam_width
+        self.tempo_MIN = tempo_MIN/60   # [bps]
+        self.tempo_MAX = tempo_MAX/60
+        self.beat_cost = beat_cost
+        self.error_cost = error_cost
+        self.decay = decay
+        self.switch_margin = switch_margin
+        self.phase_cost = phase_cost
+        self.interval_cost = interval_cost
+        self.history_length = history_length
+        self.hypotheses = []
+        self.best = None
+        self.t_last = -1    # time of the last onset
+
+    def onset(self, tOns, note=36):
+        '''
+        For an onset at tOns, update every hypothesis and estimate the
+        perceptual beat from the best.
+
+        Parameters
+        ----------
+        tOns : float
+            CPU time of onset (latency corrected).
+        note: int. MIDI note number of onset.
+        '''
+        if self.n == 0:
+            # 1. First onset: it may be on any sub beat of the bar, but is
+            # most likely on the first beat (as the InputBeatDetector assumes)
+            self.hypotheses = []
+            for k in range(self.Nb*self.beat_div):
+                BP = self.BP_BBP1 + k/self.beat_div
+                line_fit = WeightedLineFit()
+                line_fit.add(tOns, BP, 1)
+                history = tuple(deque([value], maxlen=self.history_length) for value in (tOns, BP, 1))
+                self.hypotheses.append(_Hypothesis(line_fit, history, -1, BP, BP, 0 if k == 0 else -self.phase_cost))
+
+        elif self.n == 1:
+            # 2. Second onset: branch on the number of sub beats since the
+            # first. Only the branch of the InputBeatDetector's assumption (BP 1
+            # then BP 2) has a prior score of 0, so it is the best until the
+            # onsets that follow are scored.
+            interval = tOns - self.t_last
+            branches = []
+            for hypothesis in self.hypotheses:
+                for k in range(1, 2*self.beat_div + 1):
+                    tempo = k/self.beat_div/interval if interval > 0 else 0
+                    if self.tempo_MIN <= tempo <= self.tempo_MAX:
+                        branch = hypothesis.copy()
+                        self.__update(branch, tOns, note, hypothesis.BP_ons + k/self.beat_div, 1, scored=False)
+                        if k != self.beat_div:
+                            branch.score = branch.score - self.interval_cost
+                        branches.append(branch)
+            if not branches:
+                # no tempo in range: assume BP 2, as the InputBeatDetector does
+                branch = self.hypotheses[0]
+                self.__update(branch, tOns, note, branch.BP_ons + 1, 1, scored=False)
+                branches.append(branch)
+            self.hypotheses = branches
+
+        else:
+            # 3. Later onsets: quantise with the estimate of each hypothesis
+            for hypothesis in self.hypotheses:
+                BP, acc = self.beatPositionQuantised(tOns, hypothesis.tempo, hypothesis.BP_0)
+                self.__update(hypothesis, tOns, note, BP, acc)
+
+        # 4. Keep the best hypotheses
+        self.__prune()
+        best = self.hypotheses[0]
+        if self.best in self.hypotheses and best.score - self.best.score < self.switch_margin:
+            best = self.best    # not clearly better: keep the current best
+        self.best = best
+
+        # 5. Record the estimate of the best hypothesis (as onset() of the InputBeatDetector)
+        self.t_ons.append(tOns)
+        self.BP_ons.append(best.BP_ons)
+        self.W.append(best.w)
+        if self.n > 0:
+            self.tempo.append(best.tempo)
+            self.BP_0.append(best.BP_0)
+        self.tempo.append(best.tempo)
+        self.BP_0.append(best.BP_0)
+        self.t_next_beat.append(self.getTimeOfNextBeat())
+        self.BP_next_beat.append(self.getBeatPositionOfNextBeat())
+
+        self.t_last = tOns
+        self.n = self.n + 1
+
+    def onsets(self, t_ons, notes):
+        '''
+        Calls onset() for each onset of a whole recording in turn.
+
+        Parameters
+        ----------
+        t_ons : array of onset times (latency corrected).
+        notes : array of MIDI note numbers of the onsets.
+        '''
+        for t, note in zip(list(t_ons), list(notes)):
+            self.onset(float(t), int(note))
+
+    def __update(self, hypothesis, t_ons, note, BP_ons, acc, scored=True):
+        '''
+        Adds an onset at t_ons, quantised to BP_ons with accuracy acc, to a
+        hypothesis: updates its line of best fit and (if scored) its score.
+        '''
+        w = self.weighting(note, acc, BP_ons)
+        line_fit = hypothesis.line_fit
+        line_fit.add(t_ons, BP_ons, w)
+        t_hist, BP_hist, W_hist = hypothesis.history
+        t_hist.append(t_ons)
+        BP_hist.append(BP_ons)
+        W_hist.append(w)
+
+        # update the window as the InputBeatDetector does (see its __lineOfBestFit)
+        if BP_ons < hypothesis.BP_ons:
+            hypothesis.n_descent = self.n
+        if hypothesis.n_descent <= self.n + 1 - len(line_fit):
+            line_fit.evictOutsideWindow(BP_ons, self.BP_window)
+        else:
+            line_fit.refitWindow(t_hist, BP_hist, W_hist, BP_ons, self.BP_window)
+        if len(line_fit) == 1:
+            # no other onsets within window: change the BP but not the tempo
+            hypothesis.BP_0 = BP_ons - hypothesis.tempo*t_ons
+        else:
+            hypothesis.tempo, hypothesis.BP_0 = line_fit.line()
+
+        if scored:
+            hypothesis.score = self.decay*hypothesis.score + w - self.error_cost*(1 - acc) - self.beat_cost*(BP_ons - hypothesis.BP_ons)
+        hypothesis.BP_ons = BP_ons
+        hypothesis.w = w
+
+    def __prune(self):
+        '''
+        Sorts the hypotheses by score, merges those with the same bar phase
+        and tempo (within 1%) and keeps the best [beam_width].
+        '''
+        self.hypotheses.sort(key=lambda hypothesis: hypothesis.score, reverse=True)
+        kept = []
+        merged = {}     # key of each kept hypothesis with a tempo
+        for hypothesis in self.hypotheses:
+            if hypothesis.tempo > 0:
+                if not (self.tempo_MIN <= hypothesis.tempo <= self.tempo_MAX) and kept:
+                    continue
+                key = (round(((hypothesis.BP_ons - self.BP_BBP1)%self.Nb)*self.beat_div), round(100*log(hypothesis.tempo)))
+                if key in merged:
+                    if hypothesis is self.best:
+                        self.best = merged[key]     # the best is now the one it merged into
+                    continue
+                merged[key] = hypothesis
+            kept.append(hypothesis)
+            if len(kept) == self.beam_width:
+                break
+        self.hypotheses = kept
+
+    def reset(self):
+        '''
+        Resets all IBD parameters and hypotheses
+        '''
+        InputBeatDetector.reset(self)
+        self.hypotheses = []
+        self.best = None
+        self.t_last = -1
+
+    def getHypotheses(self):
+        '''
+        Returns a list of (score, tempo, BP_0) of each hypothesis, best first
+        '''
+        return [(hypothesis.score, hypothesis.tempo, hypothesis.BP_0) for hypothesis in self.hypotheses]
@@ -0,0 +1,129 @@
+'''
+Onset Weighting
+
+Weighting of an onset in the IBD's line of best fit, by its position in the
+bar and its MIDI note, as lookup tables built once per Nb and beat_div.
+
+A profile (a dict, or the path of a JSON file) can give the tables of any
+meter and note weights, e.g.
+
+    {
+        "note_classes": {"hats": [42, 44, 46]},
+        "note_weights": {"kick": 3, "snare": 0.5, "hats": 0.2, "toms": 0.5, "other": 0.5},
+        "bars": [
+            {"Nb": 5, "beat_div": 2, "scale": [2, 0, 0.8, 0, 0.8, 0, 1.5, 0, 0.8, 0],
+             "offset": [0, 0.1, 0, 0.1, 0, 0.1, 0, 0.1, 0, 0.1]}
+        ]
+    }
+
+Every key is optional: anything not given takes its default value.
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import json
+import numpy as np
+
+# General MIDI percussion notes of each note class. Notes in no class are 'other'.
+NOTE_CLASSES = {
+    'kick': [35, 36],
+    'snare': [37, 38, 39, 40],
+    'hats': [42, 44, 46],
+    'toms': [41, 43, 45, 47, 48, 50],
+}
+
+def defaultBarWeights(Nb, beat_div):
+    '''
+    Returns the scale and offset of the weighting at each bar sub beat
+    position (bsbp 1 first), the weighting of an onset being
+    accuracy*scale + offset. Onsets on the beat are weighted higher.
+    Meters other than Nb = 4, 3 and 2 are weighted evenly.
+
+    Returns
+    -------
+    scale[], offset[]
+    '''
+    bsbp = np.arange(1, Nb*beat_div + 1)
+    scale = np.ones(len(bsbp))
+    offset = np.zeros(len(bsbp))
+    if Nb == 4:
+        strong = np.isin(bsbp, [1, 5, 9, 13])
+        medium = np.isin(bsbp, [3, 7, 11, 15])
+        weak = ~(strong | medium)
+        scale[strong] = 2
+        scale[medium] = 0.8
+        scale[weak] = 0     # between beats, the weighting is 0.1 whatever the accuracy
+        offset[weak] = 0.1
+    elif Nb == 3:
+        scale = np.where(np.isin(bsbp, [1, 4, 7, 10]), 2.5, 0.5)
+    elif Nb == 2:
+        scale[np.isin(bsbp, [1, 3, 5, 7])] = 2
+    return scale, offset
+
+def loadProfile(path):
+    '''
+    Returns the weighting profile (dict) saved as JSON at path
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+class OnsetWeighting:
+    '''
+    Lookup tables of the weighting of an onset: a scale and offset for each
+    bar sub beat position, and a multiplier for each MIDI note (by note
+    class: kick, snare, hats, toms or other).
+    '''
+
+    def __init__(self, Nb=4, beat_div=2, kick_weight=3, snare_weight=0.5, profile=None):
+        '''
+        Create new OnsetWeighting for a bar of Nb beats of beat_div sub beats.
+
+        Parameters
+        ----------
+        kick_weight: multiplier of kick onsets.
+        snare_weight: multiplier of all other onsets.
+        profile: dict or path of a JSON file of bar and note weights, which
+            take the place of the defaults (see module docstring).
+        '''
+        if isinstance(profile, str):
+            profile = loadProfile(profile)
+        profile = profile or {}
+        self.Nb = Nb
+        self.beat_div = beat_div
+
+        # 1. Weighting at each bar sub beat position
+        scale, offset = defaultBarWeights(Nb, beat_div)
+        for bar in profile.get('bars', []):
+            if bar['Nb'] == Nb and bar['beat_div'] == beat_div:
+                scale = np.asarray(bar['scale'], dtype=float)
+                offset = np.asarray(bar.get('offset', np.zeros(len(scale))), dtype=float)
+                if len(scale) != Nb*beat_div or len(offset) != Nb*beat_div:
+                    raise ValueError(f'bar weights of Nb={Nb}, beat_div={beat_div} must have {Nb*beat_div} values')
+        # (lists, as single values are looked up faster than in arrays)
+        self.scale = scale.tolist()
+        self.offset = offset.tolist()
+
+        # 2. Multiplier of each MIDI note
+        class_weights = {'kick': kick_weight, 'snare': snare_weight, 'hats': snare_weight,
+                         'toms': snare_weight, 'other': snare_weight}
+        for name, weight in profile.get('note_weights', {}).items():
+            if name not in class_weights:
+                raise ValueError(f'unknown note class: {name}')
+            class_weights[name] = weight
+        note_classes = dict(NOTE_CLASSES, **profile.get('note_classes', {}))
+        note_weights = np.full(128, class_weights['other'], dtype=float)
+        for name, notes in note_classes.items():
+            if name not in class_weights:
+                raise ValueError(f'unknown note class: {name}')
+            note_weights[notes] = class_weights[name]
+        self.note_weights = note_weights.tolist()
+
+    def weight(self, note, accuracy, position):
+        '''
+        Returns the weighting of an onset of MIDI note [note] quantised with
+        [accuracy] to bar sub beat position [position] (0 is the first sub
+        beat of the bar).
+        '''
+        return (accuracy*self.scale[position] + self.offset[position])*self.note_weights[note]
@@ -0,0 +1,169 @@
+'''
+Parameter Sweep - replays a test set for many IBD and controller parameter
+values in parallel
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import json
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+from ReplaySimulator import loadTestSet, replayTrack
+from Transport import TempoRangeError
+from report_utils import RESULTS_COLUMNS
+
+# default value of every parameter that can be swept
+DEFAULTS = {
+    'BP_window': 5,
+    'kick_weight': 3,
+    'snare_weight': 0.5,
+    'delta_latency': 0.03,
+    'epsilon_t': 0.01,
+    'T_tempo_MIN': 1,
+    'delta_tempo_max': 0.3,
+}
+
+# columns of the sweep results table. 'error' holds the reason a test could
+# not be replayed at a point (its statistics are then NaN), or is empty.
+COLUMNS = ['point'] + list(DEFAULTS) + ['track', 'pattern'] + RESULTS_COLUMNS + ['error']
+
+def parameterGrid(**values):
+    '''
+    Returns a list of parameter points (dicts), one for every combination of
+    the given values, e.g. parameterGrid(BP_window=[4, 5], delta_latency=[0.02, 0.03])
+    '''
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+def randomSample(n, seed=None, **ranges):
+    '''
+    Returns a list of n parameter points (dicts) sampled at random.
+    Each range is either a (low, high) tuple, sampled uniformly, or a list of
+    values to choose from, e.g. randomSample(20, BP_window=[3, 4, 5], epsilon_t=(0.005, 0.02))
+    '''
+    rng = np.random.default_rng(seed)
+    points = []
+    for _ in range(n):
+        point = {}
+        for name, r in ranges.items():
+            if isinstance(r, tuple):
+                point[name] = float(rng.uniform(r[0], r[1]))
+            else:
+                point[name] = r[rng.integers(len(r))]
+        points.append(point)
+    return points
+
+def pointKey(point):
+    '''
+    Returns the string identifying a parameter point in the results table.
+    Parameters not in point take their default value.
+    '''
+    params = dict(DEFAULTS)
+    params.update(point)
+    return json.dumps(params, sort_keys=True)
+
+
+# Test set of each worker process. Parsed once by the parent and passed to
+# each worker when it starts, rather than with every point.
+_tests = None
+
+def _initWorker(tests):
+    global _tests
+    _tests = tests
+
+def _runPoint(key, T_tempo, start_latency):
+    '''
+    Replays every test of the worker's test set at one parameter point.
+    Returns a list of rows of the results table (one per test).
+
+    A test in which the controller asks for a tempo out of MainStage's range
+    gets NaN statistics and the reason in the 'error' column. Any other
+    exception is raised, failing the sweep.
+    '''
+    params = json.loads(key)
+    rows = []
+    for test in _tests:
+        error = ''
+        try:
+            stats, _ = replayTrack(test['t_ons'], test['notes'], test['t_pb'], test['Nb'], test['beat_div'],
+                T_tempo, start_latency, params)
+        except TempoRangeError as e:
+            stats = [test['beat_div'], test['Nb']] + [np.nan]*(len(RESULTS_COLUMNS)-2)
+            error = str(e)
+        rows.append([key] + [params[name] for name in DEFAULTS] + [test['track'], test['pattern']] + stats + [error])
+    return rows
+
+
+def sweep(test_dir, points, results_file=None, processes=None, T_tempo=0.2, start_latency=0.09):
+    '''
+    Replays the test set in test_dir (see ReplaySimulator.loadTestSet) at every
+    parameter point, using a pool of worker processes.
+
+    If results_file (csv) is given, points already in it are not replayed
+    again, and the results of each new point are appended to it as soon as
+    they are ready. Adding points to a sweep and running it again therefore
+    only replays the new points.
+
+    Parameters
+    ----------
+    test_dir: directory holding onsets.mid and pb.mid.
+    points: list of parameter dicts (see parameterGrid() and randomSample()).
+    results_file: csv file of results, or None.
+    processes: number of worker processes (default: number of CPUs).
+
+    Returns
+    -------
+    A pandas DataFrame with a row for each point and test (see COLUMNS), in
+    the order of points.
+    '''
+    import pandas as pd
+
+    # 1. Load results of previous runs
+    keys = list(dict.fromkeys(pointKey(point) for point in points))  # unique, in order
+    if results_file is not None and os.path.exists(results_file):
+        previous = pd.read_csv(results_file)
+        if list(previous.columns) != COLUMNS:
+            # results file of an older version: rewrite it with the current
+            # columns so new rows can be appended to it
+            previous = previous.reindex(columns=COLUMNS)
+            previous.to_csv(results_file, index=False)
+    else:
+        previous = pd.DataFrame(columns=COLUMNS)
+    done = set(previous['point'])
+    todo = [key for key in keys if key not in done]
+
+    # 2. Replay new points
+    new_rows = []
+    if todo:
+        tests = loadTestSet(test_dir)   # MIDI files are parsed once, here
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=_initWorker, initargs=(tests,)) as pool:
+            futures = [pool.submit(_runPoint, key, T_tempo, start_latency) for key in todo]
+            for future in as_completed(futures):
+                rows = future.result()
+                new_rows.extend(rows)
+                if results_file is not None:
+                    # append as each point finishes, so an interrupted sweep keeps its results
+                    write_header = not os.path.exists(results_file)
+                    pd.DataFrame(rows, columns=COLUMNS).to_csv(results_file, mode='a', header=write_header, index=False)
+
+    # 3. Collect results of the requested points
+    results = pd.concat([previous, pd.DataFrame(new_rows, columns=COLUMNS)], ignore_index=True)
+    results = results[results['point'].isin(keys)]
+    order = {key: i for i, key in enumerate(keys)}
+    results = results.sort_values(['point', 'track'], key=lambda column: column.map(order) if column.name=='point' else column)
+    return results.reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    import sys
+
+    test_dir = sys.argv[1] if len(sys.argv) > 1 else 'test_sets/set_2/'
+    points = parameterGrid(BP_window=[3, 4, 5], delta_latency=list(np.arange(15/1000, 35/1000, 5/1000)))
+    results = sweep(test_dir, points, results_file=test_dir+'sweep_results.csv')
+    summary = results.groupby(list(DEFAULTS))[['RMS Error [ms]', 'IBD RMS Error [ms]']].mean()
+    print(summary.sort_values('RMS Error [ms]').to_string())
@@ -0,0 +1,297 @@
+'''
+Replay Simulator - runs BeatSync over recorded test sets in virtual time
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import math
+import time
+from timeit import default_timer as timer
+import mido
+from Transport import Transport
+from onset_cache import loadOnsetIndex, trackOnsets
+import report_utils
+
+# parameters that can be set for a replay, and the object each belongs to
+IBD_PARAMETERS = ('BP_window', 'kick_weight', 'snare_weight', 'weighting_profile')
+CONTROLLER_PARAMETERS = ('epsilon_t', 'T_tempo_MIN', 'delta_tempo_max')
+TRANSPORT_PARAMETERS = ('delta_latency',)
+
+class SimulatedMainStage:
+    '''
+    Model of MainStage as seen by the transport. Responds to the start, stop,
+    tempo (pitchwheel) and time signature (control change) messages sent by
+    the transport, and plays a click (note_on) on every machine beat division.
+
+    The click of BSBP 1 is note=60, BSBP 2 is note=61 and so on.
+    '''
+
+    def __init__(self, Nb=4, beat_div=2, start_latency=0.09):
+        '''
+        Create new, stopped SimulatedMainStage.
+
+        Parameters
+        ----------
+        Nb: number of beats per bar.
+        beat_div: number of clicks per beat.
+        start_latency: delay in seconds between a start message being received
+            and the first click.
+        '''
+        self.Nb = Nb
+        self.beat_div = beat_div
+        self.start_latency = start_latency
+
+        self.playing = False
+        self.tempo = 120/60     # [beats per second]
+        self.t_ref = 0      # time at which the machine was at BP_ref
+        self.BP_ref = 0     # beats since start (0 on first click)
+        self.n_click = 0    # index of next click
+
+    def receive(self, t, msg):
+        '''
+        Handles a MIDI message sent to MainStage at time t
+        '''
+        if msg.type=='start':
+            self.playing = True
+            self.t_ref = t + self.start_latency
+            self.BP_ref = 0
+            self.n_click = 0
+        elif msg.type=='stop':
+            self.playing = False
+        elif msg.type=='pitchwheel':
+            # inverse of changeTempoMIDIMessage()
+            tempo_new = ((msg.pitch + 8192)*0.02 + 30)/60
+            if self.playing and t > self.t_ref:
+                # tempo change takes effect from now
+                self.BP_ref = self.BP_ref + (t - self.t_ref)*self.tempo
+                self.t_ref = t
+            self.tempo = tempo_new
+        elif msg.type=='control_change' and msg.control==14:
+            # inverse of changeNbMIDIMessage()
+            self.Nb = int(msg.value*4/128) + 1
+
+    def beatPosition(self, t):
+        '''
+        Returns the number of beats the machine has played since it started
+        (0 at the first click) at time t, or None if stopped.
+        '''
+        if not self.playing:
+            return None
+        return self.BP_ref + (t - self.t_ref)*self.tempo
+
+    def nextClickTime(self):
+        '''
+        Returns the time of the next click, or infinity if stopped.
+        '''
+        if not self.playing:
+            return math.inf
+        return self.t_ref + (self.n_click/self.beat_div - self.BP_ref)/self.tempo
+
+    def click(self):
+        '''
+        Returns the MIDI message of the next click and moves on to the one after
+        '''
+        BSBP = self.n_click%(self.Nb*self.beat_div) + 1
+        self.n_click = self.n_click + 1
+        return mido.Message('note_on', note=59+BSBP, velocity=100)
+
+
+class ReplaySimulator:
+    '''
+    Replays recorded input onsets through the transport (IBD, MBD and
+    controller) and a SimulatedMainStage in virtual time.
+
+    The events the live loop would wait for (input onsets, MainStage clicks
+    and transport deadlines) are taken in time order without waiting, so a
+    test runs much faster than real time. With realtime=True each event
+    instead waits until its time on the wall clock.
+
+    A test is either replayed in one go with run(), or driven onset by onset
+    with start(), inputOnset() and runUntil().
+    '''
+
+    def __init__(self, T_tempo=0.2, start_latency=0.09, params=None, realtime=False):
+        '''
+        Create new ReplaySimulator.
+
+        Parameters
+        ----------
+        T_tempo: controller sample period in seconds.
+        start_latency: MainStage delay in seconds between receiving start and its first click.
+        params: dict of IBD, controller and transport parameters to use instead
+            of their defaults (see IBD_PARAMETERS, CONTROLLER_PARAMETERS and
+            TRANSPORT_PARAMETERS).
+        realtime: if True, events are handled at wall clock pace.
+        '''
+        self.T_tempo = T_tempo
+        self.start_latency = start_latency
+        self.params = params or {}
+        for name in self.params:
+            assert name in IBD_PARAMETERS+CONTROLLER_PARAMETERS+TRANSPORT_PARAMETERS, f"unknown parameter '{name}'"
+        self.realtime = realtime
+        self.t = 0  # virtual time [s]
+        self.t_wall_start = 0   # wall clock time of the start of the test
+
+    def start(self, Nb=4, beat_div=2):
+        '''
+        Starts a new test at time 0 with a new transport and a stopped MainStage.
+
+        Returns
+        -------
+        The transport.
+        '''
+        self.t = 0
+        self.t_wall_start = timer()
+        self.mainstage = SimulatedMainStage(Nb, start_latency=self.start_latency)
+        IBD_params = {name: value for name, value in self.params.items() if name in IBD_PARAMETERS}
+        controller_params = {name: value for name, value in self.params.items() if name in CONTROLLER_PARAMETERS}
+        self.transport = Transport(self.__send, Nb=Nb, beat_div=beat_div, T_tempo=self.T_tempo,
+            IBD_params=IBD_params, controller_params=controller_params)
+        for name in TRANSPORT_PARAMETERS:
+            if name in self.params:
+                setattr(self.transport, name, self.params[name])
+        self.mainstage.beat_div = self.transport.machine_beat_div
+        return self.transport
+
+    def runUntil(self, t_until, inclusive=True):
+        '''
+        Handles the MainStage clicks and transport deadlines due before
+        t_until (or at t_until, if inclusive), in time order.
+        '''
+        transport = self.transport
+        while True:
+            # 1. Find the next event
+            t_click = self.mainstage.nextClickTime()
+            deadline = transport.nextDeadline()
+            t_deadline = math.inf if deadline is None else deadline
+            t = min(t_click, t_deadline)
+            if t > t_until or (t == t_until and not inclusive):
+                break
+            self.__wait(t)
+            self.t = t
+
+            # 2. Handle it. The live loop calls update() after every event too
+            if t == t_click:
+                transport.machineMessage(t, self.mainstage.click())
+            transport.update(t)
+
+    def inputOnset(self, t, note):
+        '''
+        Handles everything due before t, then an input onset at t.
+        '''
+        self.runUntil(t, inclusive=False)
+        self.__wait(t)
+        self.t = t
+        self.transport.inputOnset(t, note)
+        self.transport.update(t)
+
+    def run(self, t_ons, notes, Nb=4, beat_div=2, t_end=None):
+        '''
+        Replays one test. t_ons are the input onset times in seconds from the
+        start of the test and notes their MIDI note numbers. The test runs
+        until t_end (by default one second after the last onset).
+
+        Returns
+        -------
+        The transport, holding the IBD, MBD and controller after the test.
+        '''
+        if t_end is None:
+            t_end = t_ons[-1] + 1 if len(t_ons) > 0 else 0
+
+        transport = self.start(Nb, beat_div)
+        for t, note in zip(t_ons, notes):
+            if t > t_end:
+                break
+            self.inputOnset(t, note)
+        self.runUntil(t_end)
+
+        return transport
+
+    def __wait(self, t):
+        '''
+        In realtime mode, sleeps until time t of the test
+        '''
+        if self.realtime:
+            delay = self.t_wall_start + t - timer()
+            if delay > 0:
+                time.sleep(delay)
+
+    def __send(self, msg):
+        '''
+        Sends a message from the transport to the simulated MainStage
+        '''
+        self.mainstage.receive(self.t, msg)
+
+
+def replayTrack(t_ons, notes, t_pb, Nb=4, beat_div=2, T_tempo=0.2, start_latency=0.09, params=None):
+    '''
+    Replays one test and calculates the same statistics as the END OF TEST
+    block of BeatSync. params are passed to the ReplaySimulator.
+
+    Returns
+    -------
+    row: a row of the test results spreadsheet (see report_utils.RESULTS_COLUMNS).
+    transport: the transport after the test.
+    '''
+    t_end = max(t_ons[-1], t_pb[-1]) + 1
+    simulator = ReplaySimulator(T_tempo, start_latency, params)
+    transport = simulator.run(t_ons, notes, Nb, beat_div, t_end)
+
+    t_next_beat, bp_next_beat = transport.IBD.getPredictions()
+    row, _, _, _ = report_utils.trackStats(Nb, beat_div, t_pb, transport.MBD.getBeatTimes(),
+        t_next_beat, bp_next_beat, transport.controller.getErrors(), transport.MBD.getFirstBeatIndex())
+    return row, transport
+
+def loadTestSet(test_dir):
+    '''
+    Loads every test of a test set. test_dir must contain onsets.mid and
+    pb.mid, with one track per test named 'pattern, Nb=4, beat_div=2'.
+    Track 0 of each file is skipped.
+
+    The onsets of each file are loaded from its onset cache (see onset_cache),
+    so the MIDI files are only parsed the first time.
+
+    Returns
+    -------
+    A list with a dict for each test holding its track number, pattern name,
+    Nb, beat_div, onset times t_ons, onset notes and perceptual beat times t_pb.
+    '''
+    onsets = loadOnsetIndex(test_dir+'onsets.mid')  # onsets
+    pb = loadOnsetIndex(test_dir+'pb.mid')     # perceptual beats
+
+    tests = []
+    for i in range(1, min(len(onsets['names']), len(pb['names']))):
+        t_ons, notes, _ = trackOnsets(onsets, i)
+        t_pb, _, _ = trackOnsets(pb, i)
+        tests.append({'track': i, 'pattern': str(onsets['patterns'][i]),
+            'Nb': int(onsets['Nb'][i]), 'beat_div': int(onsets['beat_div'][i]),
+            't_ons': t_ons.tolist(), 'notes': notes.tolist(), 't_pb': t_pb.tolist()})
+
+    return tests
+
+def replayTestSet(test_dir, T_tempo=0.2, start_latency=0.09, params=None):
+    '''
+    Replays every test of a test set (see loadTestSet()).
+
+    Returns
+    -------
+    A pandas DataFrame of the results of every test (one row per track).
+    '''
+    rows = []
+    for test in loadTestSet(test_dir):
+        row, _ = replayTrack(test['t_ons'], test['notes'], test['t_pb'], test['Nb'], test['beat_div'],
+            T_tempo, start_latency, params)
+        rows.append(row)
+
+    return report_utils.resultsTable(rows)
+
+
+if __name__ == '__main__':
+    import sys
+
+    test_dir = sys.argv[1] if len(sys.argv) > 1 else 'test_sets/2/'
+    t_0 = timer()
+    results = replayTestSet(test_dir)
+    print(results.to_string())
+    print(f'Replayed {len(results)} tests in {timer()-t_0:.2f} s')
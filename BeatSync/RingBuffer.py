@@ -0,0 +1,108 @@
+'''
+Ring Buffer
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import numpy as np
+
+class RingBuffer:
+    '''
+    Fixed capacity history of values, stored in a preallocated NumPy array.
+
+    Once full, appending a value overwrites the oldest value, so memory use
+    stays constant however long the session runs. Every value is written
+    twice (at i and i + capacity) so that the contents, oldest first, are
+    always one contiguous slice of the array and can be returned as a view.
+    '''
+
+    def __init__(self, capacity, dtype=np.float64):
+        '''
+        Create new, empty RingBuffer holding at most [capacity] values.
+        '''
+        assert capacity > 0, "capacity must be at least 1"
+        self.capacity = capacity
+        self.buffer = np.zeros(2*capacity, dtype=dtype)
+        self.start = 0  # index of oldest value
+        self.size = 0   # number of values stored
+        self.count = 0  # number of values added since the buffer was last cleared
+
+    def append(self, value):
+        '''
+        Adds value to the end of the buffer, overwriting the oldest value if full.
+        '''
+        if self.size < self.capacity:
+            i = (self.start + self.size) % self.capacity
+            self.size = self.size + 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.buffer[i] = value
+        self.buffer[i + self.capacity] = value
+        self.count = self.count + 1
+
+    def extend(self, values):
+        '''
+        Adds an array of values to the end of the buffer.
+        Only the last [capacity] values are kept.
+        '''
+        values = np.asarray(values)
+        k = len(values)
+        if k == 0:
+            return
+
+        end = self.start + self.size    # position after newest value
+        size_new = min(self.size + k, self.capacity)
+        # only the values that will still be held once the buffer is extended are written
+        values = values[-self.capacity:]
+        i = (end + k - len(values) + np.arange(len(values))) % self.capacity
+        self.buffer[i] = values
+        self.buffer[i + self.capacity] = values
+
+        self.start = (end + k - size_new) % self.capacity
+        self.size = size_new
+        self.count = self.count + k
+
+    def clear(self):
+        '''
+        Removes all values from the buffer
+        '''
+        self.start = 0
+        self.size = 0
+        self.count = 0
+
+    def dropped(self):
+        '''
+        Returns the number of values overwritten since the buffer was last
+        cleared, which is the index (counting every value added) of the
+        oldest value held.
+        '''
+        return self.count - self.size
+
+    def view(self):
+        '''
+        Returns a read-only array view of the values in the buffer, oldest first.
+        The view is only valid until the next value is appended.
+        '''
+        values = self.buffer[self.start:self.start + self.size]
+        values.flags.writeable = False
+        return values
+
+    def __getitem__(self, i):
+        '''
+        Returns the value at index i, where index 0 is the oldest value held
+        and index -1 is the newest.
+        '''
+        if i < 0:
+            i = i + self.size
+        if not 0 <= i < self.size:
+            raise IndexError('RingBuffer index out of range')
+        return self.buffer[self.start + i].item()
+
+    def __len__(self):
+        '''
+        Returns the number of values held in the buffer
+        '''
+        return self.size
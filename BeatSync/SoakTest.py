@@ -0,0 +1,108 @@
+'''
+Soak Test - drives BeatSync with an endless synthetic drummer
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import sys
+import resource
+import numpy as np
+from timeit import default_timer as timer
+from midi_utils import stochasticDrummerStream
+from ReplaySimulator import ReplaySimulator
+from LatencyProfiler import LatencyProfiler, latencyStats
+from RingBuffer import RingBuffer
+
+def memoryUsage():
+    '''
+    Returns the peak resident memory of this process in MB
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':    # bytes on macOS, kilobytes on Linux
+        return rss/2**20
+    return rss/2**10
+
+def soakTest(duration=3600, report_interval=60, realtime=False, Nb=4, beat_div=2, seed=None, **drummer):
+    '''
+    Plays a stochasticDrummerStream into the transport, IBD, MBD and controller
+    (through a ReplaySimulator) for [duration] seconds of simulated playing,
+    either as fast as possible or at wall clock pace (realtime=True).
+
+    Every [report_interval] simulated seconds a line is printed with the
+    memory use, IBD/MBD/controller latency and the drift of the machine beat
+    from the drummer's perceptual beat over the interval.
+
+    Keyword arguments (e.g. tempoInit, stdDev_TEMPO, stdDev_ERROR, drop,
+    fill) are passed to stochasticDrummerStream.
+
+    Returns
+    -------
+    A list with a dict of statistics for each report interval.
+    '''
+    simulator = ReplaySimulator(realtime=realtime)
+    transport = simulator.start(Nb, beat_div)
+    profiler = LatencyProfiler()
+    profiler.attach(transport)
+    profiler.startTest(simulator.t_wall_start)
+
+    drift = RingBuffer(8192)    # machine beat time error at each perceptual beat [s]
+    reports = []
+    t_report = report_interval
+    t_wall_0 = timer()
+
+    print(f'{"time [s]":>10}{"real [s]":>10}{"mem [MB]":>10}{"IBD p99 [us]":>14}{"MBD p99 [us]":>14}'
+        f'{"ctrl p99 [us]":>15}{"drift RMS [ms]":>16}{"drift max [ms]":>16}')
+
+    for t, kind, value in stochasticDrummerStream(Nb=Nb, beatDiv=beat_div, seed=seed, **drummer):
+        if t > duration:
+            break
+
+        # 1. Report
+        while t >= t_report:
+            simulator.runUntil(t_report)
+            reports.append(report(t_report, timer()-t_wall_0, profiler.getTimings(), drift.view()))
+            profiler.startTest(simulator.t_wall_start)
+            drift.clear()
+            t_report = t_report + report_interval
+
+        # 2. Drum onsets go to the transport
+        if kind == 'onset':
+            simulator.inputOnset(t, value)
+
+        # 3. Perceptual beats are compared with the machine's beat.
+        # Machine beat 0 is the first beat after the bar of sync beats.
+        elif kind == 'beat' and value > Nb:
+            simulator.runUntil(t)
+            BP_m = simulator.mainstage.beatPosition(t)
+            if BP_m is not None and BP_m >= 0:
+                error = (BP_m + Nb + 1) - value     # [beats]
+                error = (error + Nb/2)%Nb - Nb/2    # machine may have started on a later bar
+                drift.append(-error/simulator.mainstage.tempo)
+
+    return reports
+
+def report(t, t_wall, timings, drift):
+    '''
+    Prints and returns the statistics of one report interval
+    '''
+    stats = latencyStats(timings)
+    line = {
+        't': t,
+        't_wall': t_wall,
+        'memory_MB': memoryUsage(),
+        'IBD_p99_us': 1e6*stats['IBD.onset'][3],
+        'MBD_p99_us': 1e6*stats['MBD.onset'][3],
+        'controller_p99_us': 1e6*stats['controller.sample'][3],
+        'drift_rms_ms': 1000*np.sqrt(np.mean(drift**2)) if len(drift) else np.nan,
+        'drift_max_ms': 1000*np.max(abs(drift)) if len(drift) else np.nan,
+    }
+    print(f'{t:>10.0f}{t_wall:>10.1f}{line["memory_MB"]:>10.1f}{line["IBD_p99_us"]:>14.1f}{line["MBD_p99_us"]:>14.1f}'
+        f'{line["controller_p99_us"]:>15.1f}{line["drift_rms_ms"]:>16.2f}{line["drift_max_ms"]:>16.2f}')
+    return line
+
+
+if __name__ == '__main__':
+    # e.g. python SoakTest.py 7200   -> two hours of simulated playing
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    soakTest(duration, tempoInit=110, stdDev_TEMPO=1, stdDev_ERROR=8, drop=0.1, fill=0.05, seed=0)
@@ -0,0 +1,98 @@
+'''
+Tempo Map
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import numpy as np
+
+DEFAULT_TEMPO = 500000  # microseconds per beat (120 BPM) until the first set_tempo
+
+class TempoMap:
+    '''
+    Conversion between time in ticks and in seconds of a MIDI file, following
+    its tempo changes.
+
+    Time is piecewise linear in ticks, with one segment per tempo. The start
+    of every segment (in ticks and seconds) is calculated once, then any
+    number of times are converted at once by finding their segment with a
+    binary search.
+    '''
+
+    def __init__(self, tempo_ticks=(), tempos=(), ticks_per_beat=480, tempo_init=DEFAULT_TEMPO):
+        '''
+        Create new TempoMap from the times [ticks] and values [us per beat]
+        of the set_tempo events. The tempo is tempo_init until the first one.
+        '''
+        self.ticks_per_beat = ticks_per_beat
+
+        # 1. Tempo segments, in time order. The first segment, at tick 0,
+        # holds tempo_init (and is empty if a tempo change is at tick 0).
+        tempo_ticks = np.asarray(tempo_ticks, dtype=np.int64)
+        order = np.argsort(tempo_ticks, kind='stable')
+        self.segment_ticks = np.concatenate(([0], tempo_ticks[order]))
+        self.segment_tempos = np.concatenate(([tempo_init], np.asarray(tempos, dtype=np.int64)[order]))
+
+        # 2. Time [s] at the start of each segment
+        self.seconds_per_tick = self.segment_tempos*1e-6/ticks_per_beat
+        self.segment_seconds = np.concatenate(([0], np.cumsum(np.diff(self.segment_ticks)*self.seconds_per_tick[:-1])))
+
+    def __segment(self, ticks):
+        '''
+        Returns the index of the segment of each time in ticks
+        (the last one starting at or before it)
+        '''
+        return np.searchsorted(self.segment_ticks, ticks, side='right') - 1
+
+    def seconds(self, ticks):
+        '''
+        Returns the time in seconds of each time in ticks (array or number)
+        '''
+        ticks = np.asarray(ticks)
+        i = self.__segment(ticks)
+        return self.segment_seconds[i] + (ticks - self.segment_ticks[i])*self.seconds_per_tick[i]
+
+    def ticks(self, seconds):
+        '''
+        Returns the time in ticks (not rounded) of each time in seconds (array or number)
+        '''
+        seconds = np.asarray(seconds)
+        i = np.searchsorted(self.segment_seconds, seconds, side='right') - 1
+        return self.segment_ticks[i] + (seconds - self.segment_seconds[i])/self.seconds_per_tick[i]
+
+    def tempo(self, ticks):
+        '''
+        Returns the tempo [us per beat] at each time in ticks (array or number)
+        '''
+        return self.segment_tempos[self.__segment(np.asarray(ticks))]
+
+
+def trackTicks(midi_track):
+    '''
+    Returns an array of the time in ticks from the start of the track of
+    each message in a mido MidiTrack
+    '''
+    return np.cumsum(np.fromiter((msg.time for msg in midi_track), dtype=np.int64, count=len(midi_track)))
+
+def tracksTempoMap(midi_tracks, ticks_per_beat=480, tempo_init=DEFAULT_TEMPO):
+    '''
+    Returns the TempoMap made by the set_tempo messages of the given mido
+    tracks, e.g. all tracks of a type 1 MidiFile, or a single track.
+    '''
+    tempo_ticks = []
+    tempos = []
+    for track in midi_tracks:
+        ticks = trackTicks(track)
+        for tick, msg in zip(ticks.tolist(), track):
+            if msg.type == 'set_tempo':
+                tempo_ticks.append(tick)
+                tempos.append(msg.tempo)
+    return TempoMap(tempo_ticks, tempos, ticks_per_beat, tempo_init)
+
+def midiFileTempoMap(midi):
+    '''
+    Returns the TempoMap of a mido MidiFile, as a sequencer plays it: the
+    set_tempo messages of all of its tracks.
+    '''
+    return tracksTempoMap(midi.tracks, midi.ticks_per_beat)
@@ -0,0 +1,114 @@
+'''
+Test Reporter - produces BeatSync test reports in a background process
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import multiprocessing
+import queue
+import traceback
+import numpy as np
+
+class ReportError(RuntimeError):
+    '''
+    Raised by TestReporter.close() when a report failed
+    '''
+
+def reportWorker(jobs, errors, test_dir):
+    '''
+    Runs in the reporting process. Produces the report of each test taken
+    from the jobs queue until None is received. The traceback of each
+    report that fails is put on the errors queue.
+    '''
+    # statistics, plotting and spreadsheet libraries are only needed here
+    import report_utils
+
+    rows = []   # one row of results per test
+    while True:
+        job = jobs.get()
+        if job is None:     # True when reporter is closed
+            break
+        name, args = job
+        try:
+            if name == 'track':
+                rows.append(report_utils.trackReport(test_dir, **args))
+            elif name == 'results':
+                report_utils.writeResults(rows, test_dir)
+        except Exception:
+            # a failed report must not stop the reports of later tests,
+            # so the failure is passed to the parent and reporting carries on
+            description = f"track {args['test_num']}" if name == 'track' else name
+            trace = traceback.format_exc()
+            print(f'Report failed ({description}):\n{trace}')
+            errors.put((description, trace))
+
+class TestReporter:
+    '''
+    Calculates test statistics, saves plots and error arrays and writes the
+    results spreadsheet in a separate process, so the transport loop keeps
+    servicing onsets at full rate while a report is produced.
+
+    Reports are produced in the order they are requested.
+    '''
+
+    def __init__(self, test_dir):
+        '''
+        Create new TestReporter and start its reporting process.
+        Reports are saved to test_dir.
+        '''
+        # spawn (rather than fork) so the reporting process does not inherit
+        # the parent's MIDI ports and receive threads
+        context = multiprocessing.get_context('spawn')
+        self.jobs = context.Queue()
+        self.errors = context.Queue()   # (report, traceback) of each failed report
+        self.process = context.Process(target=reportWorker, args=(self.jobs, self.errors, test_dir), daemon=True)
+        self.process.start()
+
+    def reportTrack(self, test_num, Nb, beat_div, t_pb, IBD, MBD, controller, profiler=None):
+        '''
+        Queues the report of one test. A snapshot of the detector and
+        controller state (and of the profiler's timings, if given) is taken
+        now, so the objects can carry on being used (or be reset) straight away.
+        '''
+        t_next_beat, bp_next_beat = IBD.getPredictions()
+        snapshot = {
+            'test_num': test_num,
+            'Nb': Nb,
+            'beat_div': beat_div,
+            't_pb': np.array(t_pb),
+            't_mb': np.array(MBD.getBeatTimes()),
+            'mb_start': MBD.getFirstBeatIndex(),
+            't_next_beat': np.array(t_next_beat),
+            'bp_next_beat': np.array(bp_next_beat),
+            'controller_errors': np.array(controller.getErrors()),
+            'latencies': None if profiler is None else profiler.getTimings(),
+        }
+        self.jobs.put(('track', snapshot))
+
+    def reportResults(self):
+        '''
+        Queues writing the results of all tests reported so far to a spreadsheet.
+        '''
+        self.jobs.put(('results', None))
+
+    def close(self, timeout=None):
+        '''
+        Waits for queued reports to finish, then stops the reporting process.
+        Raises ReportError if any report failed or the reporting process
+        did not finish.
+        '''
+        self.jobs.put(None)
+        self.process.join(timeout)
+
+        failures = []
+        while True:
+            try:
+                failures.append(self.errors.get(timeout=0.1))
+            except queue.Empty:
+                break
+        if failures:
+            raise ReportError(f'{len(failures)} report(s) failed:\n' +
+                '\n'.join(f'{description}:\n{trace}' for description, trace in failures))
+        if self.process.exitcode != 0:
+            raise ReportError(f'reporting process did not finish (exit code {self.process.exitcode})')
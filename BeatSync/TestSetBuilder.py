@@ -0,0 +1,149 @@
+'''
+Test Set Builder - generates reproducible synthetic test sets in parallel
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+from midi_utils import stochasticDrummer, midiTrack2Onsets
+
+# default value of every scenario parameter (see stochasticDrummer)
+SCENARIO_DEFAULTS = {
+    'pattern': 'sd',        # pattern name, stored in the track name
+    'tempo': 120,           # initial tempo [BPM]
+    'stdDev_TEMPO': 0,      # std. deviation of beat interval change [ms]
+    'stdDev_ERROR': 0,      # std. deviation of onset error [ms]
+    'Nb': 4,
+    'beatDiv': 2,
+    'pattern_KICK': [],     # [] -> stochasticDrummer's default pattern
+    'pattern_SNARE': [],
+    'prob': [],
+    'NumBars': 32,
+}
+
+# MIDI note numbers
+PB_NOTE = 56    # perceptual beat (cowbell)
+
+# test set files are written at a constant tempo. Each test's own tempo
+# changes are in the times of its notes, so the tracks can share track 0.
+TICKS_PER_BEAT = 480
+TEMPO = 500000      # 120 BPM
+NOTE_LENGTH = 60    # ticks
+
+
+def trackName(scenario):
+    '''
+    Returns the name of the track of a scenario, e.g. 'sd, Nb=4, beat_div=2'
+    '''
+    if ',' in str(scenario['pattern']):
+        raise ValueError(f'pattern name must not contain a comma: {scenario["pattern"]}')
+    return f'{scenario["pattern"]}, Nb={scenario["Nb"]}, beat_div={scenario["beatDiv"]}'
+
+def _generateScenario(scenario, seed_sequence):
+    '''
+    Plays one scenario with the stochasticDrummer, using its own random stream.
+
+    Returns
+    -------
+    t_ons, notes, t_pb: onset times and notes, and the perceptual beat times
+    after the bar of sync beats [s]
+    '''
+    onsets, p_beats = stochasticDrummer(tempoInit=scenario['tempo'], stdDev_TEMPO=scenario['stdDev_TEMPO'],
+        stdDev_ERROR=scenario['stdDev_ERROR'], pattern_KICK=scenario['pattern_KICK'],
+        pattern_SNARE=scenario['pattern_SNARE'], prob=scenario['prob'], Nb=scenario['Nb'],
+        beatDiv=scenario['beatDiv'], NumBars=scenario['NumBars'], syncBeats=True,
+        seperateFiles=True, seed=np.random.default_rng(seed_sequence))
+
+    # (times follow the tempo changes of the drummer within each track)
+    t_ons, notes = midiTrack2Onsets(onsets.tracks[0], onsets.ticks_per_beat)
+    t_pb, _ = midiTrack2Onsets(p_beats.tracks[0], p_beats.ticks_per_beat)
+    return np.array(t_ons), np.array(notes), np.array(t_pb[1:])   # the pb track has one beat for the whole sync bar
+
+def _notesTrack(name, times, notes):
+    '''
+    Returns a MidiTrack with a note at each time [s] (at TEMPO).
+    Note offs come before note ons at the same tick.
+    '''
+    ticks = np.rint(np.asarray(times)/(TEMPO*1e-6/TICKS_PER_BEAT)).astype(np.int64)
+    notes = np.asarray(notes)
+
+    # note on and note off events, sorted by tick then note_off first
+    event_ticks = np.concatenate((ticks, ticks + NOTE_LENGTH))
+    is_note_on = np.concatenate((np.ones(len(ticks), dtype=bool), np.zeros(len(ticks), dtype=bool)))
+    event_notes = np.concatenate((notes, notes))
+    order = np.lexsort((is_note_on, event_ticks))
+    deltas = np.diff(event_ticks[order], prepend=0)
+
+    track = MidiTrack()
+    track.name = name
+    for delta, note_on, note in zip(deltas.tolist(), is_note_on[order].tolist(), event_notes[order].tolist()):
+        track.append(Message('note_on' if note_on else 'note_off', note=note, velocity=127, time=delta))
+    return track
+
+def buildTestSet(test_dir, scenarios, seed=0, processes=None):
+    '''
+    Generates a test of every scenario and saves them as onsets.mid and
+    pb.mid in test_dir, in the layout BeatSync.py, ReplaySimulator and the
+    notebooks expect: track 0 holds the tempo, then one track per test named
+    'pattern, Nb=4, beat_div=2'. Onset tests start with a bar of sync beats.
+    Perceptual beat tracks start after it.
+
+    Each scenario gets its own random stream, spawned from the master seed,
+    so a test set is reproduced exactly by the same seed and scenarios
+    however many processes generate it.
+
+    Parameters
+    ----------
+    test_dir: directory to save the test set in (created if needed).
+    scenarios: list of dicts of scenario parameters. Parameters not given
+        take their value in SCENARIO_DEFAULTS.
+    seed: master seed.
+    processes: number of worker processes (default: number of CPUs).
+
+    Returns
+    -------
+    The list of track names of the tests (track 1 first).
+    '''
+    scenarios = [dict(SCENARIO_DEFAULTS, **scenario) for scenario in scenarios]
+    names = [trackName(scenario) for scenario in scenarios]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(scenarios))
+
+    # 1. Generate the tests in parallel
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        tests = list(pool.map(_generateScenario, scenarios, seed_sequences))
+
+    # 2. Save onsets and perceptual beats, one track per test
+    onsets = MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    pb = MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    for midi in (onsets, pb):
+        conductor = MidiTrack()
+        conductor.append(MetaMessage('set_tempo', tempo=TEMPO, time=0))
+        midi.tracks.append(conductor)
+
+    for name, (t_ons, notes, t_pb) in zip(names, tests):
+        onsets.tracks.append(_notesTrack(name, t_ons, notes))
+        pb.tracks.append(_notesTrack(name, t_pb, np.full(len(t_pb), PB_NOTE)))
+
+    os.makedirs(test_dir, exist_ok=True)
+    onsets.save(os.path.join(test_dir, 'onsets.mid'))
+    pb.save(os.path.join(test_dir, 'pb.mid'))
+    return names
+
+
+if __name__ == '__main__':
+    import sys
+    import itertools
+
+    # e.g. python TestSetBuilder.py test_sets/synthetic/ 2020
+    test_dir = sys.argv[1] if len(sys.argv) > 1 else 'test_sets/synthetic/'
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    scenarios = [{'pattern': f'sd {tempo}bpm', 'tempo': tempo, 'stdDev_TEMPO': stdDev_TEMPO, 'stdDev_ERROR': stdDev_ERROR}
+        for tempo, stdDev_TEMPO, stdDev_ERROR in itertools.product([80, 110, 140], [0, 2], [5, 15])]
+    for name in buildTestSet(test_dir, scenarios, seed):
+        print(name)
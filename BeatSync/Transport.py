@@ -0,0 +1,190 @@
+'''
+Beat Sync Transport
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import mido
+from MachineBeatDetector import MachineBeatDetector
+from InputBeatDetector import InputBeatDetector
+from Controller import Controller
+
+# Define MIDI messages
+START = mido.Message('start')
+STOP = mido.Message('stop')
+
+def changeNbMIDIMessage(Nb):
+    '''
+    Returns a control change message to change the patch in MainStage to one at the correct time signature
+    '''
+    resolution = 4  # number of possible Nb values
+
+    cc_value = int(round((Nb-1)*128/resolution + 128/(2*resolution)))
+    cc = mido.Message('control_change', control=14, value=cc_value)
+    return cc
+
+
+class TempoRangeError(ValueError):
+    '''
+    Raised when a tempo change is outside of the range MainStage can play
+    '''
+
+
+def changeTempoMIDIMessage(tempo_change:float):
+    '''
+    Returns a mido.Message object to be sent to MainStage to change
+    the tempo to tempo_change.
+
+    Params
+    ------
+    tempo_change: a tempo in beats per second.
+    '''
+    tempo = tempo_change*60 # convert tempo to beats per minute
+    if not ((tempo>=30) and (tempo<=357.66)):
+        raise TempoRangeError(f"tempo must be in the range 30-300 bpm (got {tempo:.1f} bpm)")
+
+    tempo_MIN = 30
+    res = 0.02 # resolution
+
+    # create a pitchwheel MIDI message to send to MainStage. When MainStage
+    # receives this MIDI message, it will change its tempo to the value set here.
+    pitch_val = int((tempo - tempo_MIN)/res - 8192)
+    pitch_msg = mido.Message('pitchwheel', pitch=pitch_val)
+
+    return pitch_msg
+
+
+class Transport:
+    '''
+    Runs the beat sync algorithm: passes input and machine onsets to the IBD
+    and MBD, schedules the machine start and samples the controller.
+
+    The transport does no waiting of its own. nextDeadline() gives the time
+    at which update() must next be called, so the caller can sleep until then
+    or until the next MIDI message arrives. All times are in seconds relative
+    to the start of the test.
+    '''
+
+    def __init__(self, send, Nb=4, beat_div=2, T_tempo=0.2, IBD_params=None, controller_params=None):
+        '''
+        Create new Transport.
+
+        Parameters
+        ----------
+        send: function that sends a mido.Message to MainStage.
+        Nb: number of beats per bar.
+        beat_div: beat division of input.
+        T_tempo: controller sample period in seconds.
+        IBD_params: dict of keyword arguments for each new InputBeatDetector (e.g. BP_window).
+        controller_params: dict of keyword arguments for each new Controller (e.g. epsilon_t).
+        '''
+        self.send = send
+        self.T_tempo = T_tempo
+        self.IBD_params = IBD_params or {}
+        self.controller_params = controller_params or {}
+
+        # latency correction
+        self.delta_latency = 0.03   # onset detector latency correction
+        self.tau_m_delay = 0    # add to machine onset times. TODO: Calculate this by experimentation
+        self.tau_c_exec = 0.01  # controller samples earlier by this amount
+        self.tau_c_delay = 0.008
+        self.delta_start = 0.09
+
+        self.reset(Nb, beat_div)
+
+    def reset(self, Nb=4, beat_div=2):
+        '''
+        Creates new IBD, MBD and controller objects and resets all algorithm state variables
+        '''
+        self.IBD = InputBeatDetector(Nb=Nb, beat_div=beat_div, **self.IBD_params)
+        self.MBD = MachineBeatDetector(Nb)
+        self.controller = Controller(Nb=Nb, **self.controller_params)
+
+        # machine parameters
+        self.machine_beat_div = self.MBD.getBeatDivision() # must match the beat_div set in MainStage
+
+        # algorithm state variables
+        self.machine_playing = False
+        self.start_scheduled = False
+        self.t_send_start = 0
+        self.controller_on = False
+        self.controller_set = False
+        self.t_tempo_NEXT = self.T_tempo
+        self.tempo_m_NEW = (120)/60
+        self.tempo_new_MIDI_MESSAGE = changeTempoMIDIMessage(self.tempo_m_NEW)
+
+    def inputOnset(self, t, note):
+        '''
+        Passes an input (e.g. drummer) onset at time t to the IBD and, if the
+        machine is not yet playing, schedules the machine start.
+        '''
+        self.IBD.onset(t - self.delta_latency, note=note)      # send onset to IBD
+        if not self.machine_playing:
+            if self.IBD.getBarBeatPositionOfNextBeat()==1:  # True if next beat is start of bar
+                self.t_send_start = self.IBD.getTimeOfNextBeat() # schedule a start time
+                self.start_scheduled = True
+                self.tempo_new_MIDI_MESSAGE = changeTempoMIDIMessage(self.IBD.getTempo()*0.7)
+                self.send(self.tempo_new_MIDI_MESSAGE)
+
+    def machineMessage(self, t, msg):
+        '''
+        Passes a MIDI message received from MainStage at time t to the MBD.
+        '''
+        if msg.type=='note_on':
+            # The note value of machine onsets gives the BSBP
+            # BSBP 1 is note=60, BSBP 2 is note=61 and so on
+            # we convert BSBP into BBP and send to MBD
+            self.MBD.onset(t+self.tau_m_delay, ((msg.note-59)-1)/self.machine_beat_div+1)
+        elif msg.type=='stop':
+            self.MBD.reset()
+
+    def nextDeadline(self):
+        '''
+        Returns the time at which update() must next be called,
+        or None if nothing is scheduled.
+        '''
+        deadline = None
+        if self.controller_on:
+            if self.controller_set:     # True if controller has already sampled
+                deadline = self.t_tempo_NEXT - self.tau_c_delay     # time to send tempo change
+            else:
+                deadline = self.t_tempo_NEXT - self.tau_c_exec - self.tau_c_delay    # time to sample
+        if self.start_scheduled:
+            t_start = self.t_send_start - self.delta_start
+            if deadline is None or t_start < deadline:
+                deadline = t_start
+        return deadline
+
+    def update(self, t):
+        '''
+        Samples the controller, sends tempo changes and sends the scheduled
+        start if they are due at time t.
+        '''
+        # 1. Initiate controller sampling if controller on
+        if self.controller_on:
+            # TODO: calculate tau_m_delay
+            # TODO: controller must have large delta_tempo_max if very out of sync
+            if self.controller_set:  # True if controller has already sampled
+                if t >= (self.t_tempo_NEXT - self.tau_c_delay):  # True if it is time to send tempo change
+                    # first, check that new tempo is not -1 indicating no change
+                    if self.tempo_m_NEW != -1:  # True if tempo change must happen
+                        self.send(self.tempo_new_MIDI_MESSAGE)  # change MS tempo
+                        self.MBD.tempoChange(t, self.tempo_m_NEW)   # send tempo change to MBD
+                    self.t_tempo_NEXT = self.t_tempo_NEXT + self.T_tempo # set next sample time
+                    self.controller_set = False
+            elif t >= (self.t_tempo_NEXT - self.tau_c_exec - self.tau_c_delay):
+                # It is time for the controller to sample IBD and MBD
+                self.tempo_m_NEW = self.controller.sample(self.t_tempo_NEXT, self.IBD, self.MBD)
+                self.controller_set = True
+                if self.tempo_m_NEW != -1:
+                    self.tempo_new_MIDI_MESSAGE = changeTempoMIDIMessage(self.tempo_m_NEW)
+
+        # 2. Check if a start is scheduled
+        if self.start_scheduled:
+            if t >= (self.t_send_start - self.delta_start):    # True if time to start the bar
+                self.send(START)  # send start message
+                self.controller_on = True
+                self.t_tempo_NEXT = t+self.T_tempo
+                self.machine_playing = True
+                self.start_scheduled = False
@@ -0,0 +1,194 @@
+'''
+Weighted Line Fit
+
+@author: Ben Adey
+@year: 2020
+'''
+
+from collections import deque
+
+class WeightedLineFit:
+    '''
+    Sliding window weighted least squares line of best fit.
+
+    Running sums of w, wx, wx^2, wy and wxy are kept for the points inside the
+    window, so adding a point or evicting the oldest point costs constant time.
+    '''
+
+    def __init__(self):
+        '''
+        Create new, empty WeightedLineFit.
+        '''
+        # points currently within the window (oldest first)
+        self.x = deque()
+        self.y = deque()
+        self.w = deque()
+
+        # x values are summed relative to x_ref to limit rounding error
+        # when x is a large absolute time.
+        self.x_ref = 0
+        self.n_evicted = 0  # number of points evicted since sums were last rebuilt
+        self.__clearSums()
+
+    def __clearSums(self):
+        '''
+        Sets all running sums to zero
+        '''
+        self.sum_w = 0
+        self.sum_wx = 0
+        self.sum_wx_2 = 0
+        self.sum_wy = 0
+        self.sum_wxy = 0
+
+    def __rebuildSums(self):
+        '''
+        Recalculates the running sums from the points in the window.
+
+        Called once the window has been completely replaced since the last
+        rebuild, so rounding error from repeated add/subtract cannot build up.
+        Cost is amortised over the evictions, keeping each update O(1).
+        '''
+        self.__clearSums()
+        self.n_evicted = 0
+        if not self.x:
+            return
+
+        self.x_ref = self.x[0]
+        for x, y, w in zip(self.x, self.y, self.w):
+            dx = x - self.x_ref
+            self.sum_w = self.sum_w + w
+            self.sum_wx = self.sum_wx + w*dx
+            self.sum_wx_2 = self.sum_wx_2 + w*dx*dx
+            self.sum_wy = self.sum_wy + w*y
+            self.sum_wxy = self.sum_wxy + w*dx*y
+
+    def add(self, x, y, w=1):
+        '''
+        Adds the point (x, y) with weighting w to the window.
+        '''
+        if not self.x:  # True if window is empty
+            self.x_ref = x
+
+        self.x.append(x)
+        self.y.append(y)
+        self.w.append(w)
+
+        dx = x - self.x_ref
+        self.sum_w = self.sum_w + w
+        self.sum_wx = self.sum_wx + w*dx
+        self.sum_wx_2 = self.sum_wx_2 + w*dx*dx
+        self.sum_wy = self.sum_wy + w*y
+        self.sum_wxy = self.sum_wxy + w*dx*y
+
+    def evictOldest(self):
+        '''
+        Removes the oldest point from the window.
+        '''
+        x = self.x.popleft()
+        y = self.y.popleft()
+        w = self.w.popleft()
+
+        dx = x - self.x_ref
+        self.sum_w = self.sum_w - w
+        self.sum_wx = self.sum_wx - w*dx
+        self.sum_wx_2 = self.sum_wx_2 - w*dx*dx
+        self.sum_wy = self.sum_wy - w*y
+        self.sum_wxy = self.sum_wxy - w*dx*y
+
+        self.n_evicted = self.n_evicted + 1
+        if self.n_evicted >= len(self.x):
+            self.__rebuildSums()
+
+    def evictOutsideWindow(self, y_current, y_window):
+        '''
+        Evicts old points lying more than y_window below y_current.
+
+        The most recent point outside the window is kept, matching the window
+        used by the beat detectors (which scan back to, and include, the first
+        onset outside of the window). This is only that window while y never
+        decreases from the oldest point in the window to the newest.
+        '''
+        while len(self.y) > 1 and y_current - self.y[1] > y_window:
+            self.evictOldest()
+
+    def refitWindow(self, x, y, w, y_current, y_window):
+        '''
+        Replaces the points in the window with the points (x, y, w) (oldest
+        first) from the most recent one lying more than y_window below
+        y_current, or with all of them if there is none. Use this in place of
+        evictOutsideWindow once y has decreased within the window.
+        '''
+        i_window = 0
+        for i in range(len(y) - 1, -1, -1):
+            if y_current - y[i] > y_window:
+                i_window = i
+                break
+        self.clear()
+        for i in range(i_window, len(y)):
+            self.add(float(x[i]), float(y[i]), float(w[i]))
+
+    def clear(self):
+        '''
+        Removes all points from the window
+        '''
+        self.x.clear()
+        self.y.clear()
+        self.w.clear()
+        self.x_ref = 0
+        self.n_evicted = 0
+        self.__clearSums()
+
+    def copy(self):
+        '''
+        Returns a new WeightedLineFit with the same points and running sums,
+        which can then be updated independently of this one.
+        '''
+        fit = WeightedLineFit()
+        fit.x = self.x.copy()
+        fit.y = self.y.copy()
+        fit.w = self.w.copy()
+        fit.x_ref = self.x_ref
+        fit.n_evicted = self.n_evicted
+        fit.sum_w = self.sum_w
+        fit.sum_wx = self.sum_wx
+        fit.sum_wx_2 = self.sum_wx_2
+        fit.sum_wy = self.sum_wy
+        fit.sum_wxy = self.sum_wxy
+        return fit
+
+    def line(self):
+        '''
+        Returns the slope and y intercept of the weighted line of best fit
+        through the points in the window. At least two points are required.
+
+        Returns
+        -------
+        m, b
+        '''
+        n = self.sum_w
+        m = (n*self.sum_wxy - self.sum_wx*self.sum_wy)/(n*self.sum_wx_2 - self.sum_wx**2)
+        b = (self.sum_wy - m*self.sum_wx)/n - m*self.x_ref
+        return m, b
+
+    def intercept(self, m):
+        '''
+        Returns the y intercept of the line with slope m passing through the
+        weighted centre of mass of the points in the window.
+        '''
+        return (self.sum_wy - m*self.sum_wx)/self.sum_w - m*self.x_ref
+
+    def meanInterval(self):
+        '''
+        Returns the mean interval between consecutive x values in the window.
+        At least two points are required.
+        '''
+        # the intervals sum to the distance between the oldest and newest
+        # point. This equals the mean of the intervals within float rounding
+        # (it can differ from summing them in the last bit).
+        return (self.x[-1] - self.x[0])/(len(self.x) - 1)
+
+    def __len__(self):
+        '''
+        Returns the number of points within the window
+        '''
+        return len(self.x)
@@ -7,13 +7,14 @@ Created on Sat Sep  5 10:37:56 2020
 """
 from mido import MidiFile, Message, MidiTrack, tick2second, bpm2tempo, \
 second2tick, MetaMessage
-import random
 import numpy as np
 import math
-from operator import itemgetter
-from PerceptualBeatEstimator import PerceptualBeatEstimator
+import heapq
+from TempoMap import TempoMap, trackTicks, midiFileTempoMap
+import io
+import struct
 
-def midi2string(midi: MidiFile):
+def midi2string(midi: MidiFile, tracks=None, types=None):
     '''
     Return a string containing each midi message on a newline.
     Meta messages are indented.
@@ -21,6 +22,7 @@ def midi2string(midi: MidiFile):
     Parameters
     ----------
     midi : A MidiFile object
+    tracks, types : see writeMidi
 
     Returns
     -------
@@ -28,21 +30,47 @@ def midi2string(midi: MidiFile):
 
     '''
     
-    string = ''
+    stream = io.StringIO()
+    writeMidi(midi, stream, tracks=tracks, types=types)
+    return stream.getvalue()
+
+def writeMidi(midi: MidiFile, stream, tracks=None, types=None):
+    '''
+    Writes each midi message on a newline to a text stream (or to the file
+    at the path [stream]), in the same format as midi2string.
+
+    Lines are written as each message is read, so the whole text is never
+    held in memory and the time taken is linear in the number of messages.
+
+    Parameters
+    ----------
+    midi : A MidiFile object
+    stream : an open text stream (e.g. a file or sys.stdout) or a file path
+    tracks : optional collection of track indices to write. Default is all tracks.
+    types : optional collection of message types (e.g. 'note_on', 'set_tempo')
+        to write. Default is all messages.
+    '''
+
+    if isinstance(stream, str):    # True if given a file path
+        with open(stream, 'w') as textfile:
+            writeMidi(midi, textfile, tracks=tracks, types=types)
+        return
 
     # iterate through each track (up to 16 midi tracks)
     for i, track in enumerate(midi.tracks):
-        string = string + 'Track {}: {}'.format(i, track.name) + '\n'
-        
+        if tracks is not None and i not in tracks:
+            continue
+        stream.write(f'Track {i}: {track.name}\n')
+
         # iterate through each message in track i
         for msg in track:
+            if types is not None and msg.type not in types:
+                continue
             if msg.is_meta:
-                string = string + '\t' + str(msg) + '\n'
+                stream.write(f'\t{msg}\n')
             else:
-                string = string + str(msg) + '\n'
-        string = string + '\n'
-    
-    return string
+                stream.write(f'{msg}\n')
+        stream.write('\n')
 
 def midi2times(midi: MidiFile):
     '''
@@ -60,20 +88,12 @@ def midi2times(midi: MidiFile):
         A list of onset times.
 
     '''
-    times = []
-    time = 0  # world clock time
-    tempo = 500000
-    
     # iterate only through track 0
-    for msg in midi.tracks[0]:
-        time = time + tick2second(msg.time, midi.ticks_per_beat, tempo)
-        if msg.type=='set_tempo':
-            tempo = msg.tempo
-        if msg.type=='note_on':
-            if msg.velocity != 0:
-                times.append(time)
+    track = midi.tracks[0]
+    is_onset = np.array([msg.type=='note_on' and msg.velocity != 0 for msg in track], dtype=bool)
+    times = midiFileTempoMap(midi).seconds(trackTicks(track)[is_onset])
     
-    return times
+    return times.tolist()
 
 def times2midi(times: list, tempo:float=120, note=37, note_length=167, track_name='track'):
     '''
@@ -100,6 +120,7 @@ def times2midi(times: list, tempo:float=120, note=37, note_length=167, track_nam
         A MidiFile object containing a note_on message for every time
         in times:list.
 
+    See times2smf for a faster export of large sessions straight to bytes.
     '''
     midi = MidiFile()
     track = MidiTrack()
@@ -133,6 +154,103 @@ def times2midi(times: list, tempo:float=120, note=37, note_length=167, track_nam
     # return a MidiFile object
     return midi
 
+def times2smf(times, notes=37, velocities=98, tempo:float=120, note_length=167, track_name='track', ticks_per_beat=480):
+    '''
+    Returns the bytes of a Standard MIDI File containing a single track with
+    a note_on message at every time in the input times array.
+
+    Same output as times2midi(...).save() for the same input, but the ticks
+    are calculated and the track serialised with array operations rather
+    than a mido Message per note, so large sessions export quickly.
+
+    Parameters
+    ----------
+    times : array
+        Absolute times of note onsets [s], measured from the start of the track.
+    notes : int or array, optional
+        MIDI note number of each onset. The default is 37.
+    velocities : int or array, optional
+        Velocity of each onset. The default is 98.
+    tempo : float, optional
+        Tempo of output MIDI file in bpm. The default is 120.
+    note_length : int, optional
+        Length of each output note in ticks. The default is 167.
+    track_name : str, optional
+        Name of MIDI track. The default is 'track'.
+    ticks_per_beat : int, optional
+        MIDI file resolution. The default is 480 (as MidiFile()).
+
+    Returns
+    -------
+    data : bytes
+        The MIDI file, e.g. to be written to a file opened with 'wb'.
+    '''
+    times = np.asarray(times, dtype=float)
+    n = len(times)
+    notes = np.broadcast_to(np.asarray(notes, dtype=np.int64), (n,))
+    velocities = np.broadcast_to(np.asarray(velocities, dtype=np.int64), (n,))
+    if np.any((notes < 0) | (notes > 127)) or np.any((velocities < 0) | (velocities > 127)):
+        raise ValueError('note and velocity must be in range 0..127')
+
+    # 1. Absolute and delta ticks of each note_on
+    ppq = bpm2tempo(tempo)
+    abs_ticks = np.rint(times/(ppq*1e-6/ticks_per_beat)).astype(np.int64)
+    # each note_off is 167 ticks after its note_on (as in times2midi)
+    ticks_interval = np.diff(abs_ticks, prepend=0)
+    ticks_interval[1:] = ticks_interval[1:] - 167
+    if np.any(ticks_interval < 0) or note_length < 0:
+        raise ValueError('message time must be non-negative in MIDI file')
+
+    # 2. Note events: one row of [delta, status, note, velocity] x2 per onset
+    delta_on, len_on = varLenBytes(ticks_interval)
+    delta_off, len_off = varLenBytes(np.full(n, note_length))
+    events = np.zeros((n, 14), dtype=np.uint8)
+    valid = np.zeros((n, 14), dtype=bool)
+    events[:, 0:4] = delta_on
+    valid[:, 0:4] = np.arange(4) < len_on[:, None]
+    events[:, 4:7] = np.column_stack((np.full(n, 0x90), notes, velocities))
+    events[:, 7:11] = delta_off
+    valid[:, 7:11] = np.arange(4) < len_off[:, None]
+    events[:, 11:14] = np.column_stack((np.full(n, 0x80), notes, velocities))
+    valid[:, 4:7] = True
+    valid[:, 11:14] = True
+
+    # 3. Track chunk: track name, tempo, notes, end of track
+    name = track_name.encode('latin1')
+    name_length, name_length_bytes = varLenBytes([len(name)])
+    data = bytearray(b'\x00\xff\x03')
+    data.extend(name_length[0, :name_length_bytes[0]].tobytes())
+    data.extend(name)
+    data.extend(b'\x00\xff\x51\x03' + ppq.to_bytes(3, 'big'))
+    data.extend(events[valid].tobytes())
+    data.extend(b'\x00\xff\x2f\x00')
+
+    return (b'MThd' + struct.pack('>Lhhh', 6, 1, 1, ticks_per_beat)
+        + b'MTrk' + struct.pack('>L', len(data)) + bytes(data))
+
+def varLenBytes(values):
+    '''
+    Encodes an array of non-negative integers (< 2^28) as MIDI variable
+    length quantities.
+
+    Returns
+    -------
+    data : array of shape (n, 4) with the bytes of each value, most significant first
+    lengths : array of the number of bytes used by each value (data[i, :lengths[i]])
+    '''
+    values = np.asarray(values, dtype=np.int64)
+    lengths = 1 + (values >= 1<<7) + (values >= 1<<14) + (values >= 1<<21)
+
+    # 7 bit groups, least significant in the last column
+    groups = (values[:, None] >> np.array([21, 14, 7, 0])) & 0x7f
+    # shift each row left so it starts at its most significant group
+    columns = np.arange(4) + (4 - lengths[:, None])
+    columns = np.minimum(columns, 3)
+    data = np.take_along_axis(groups, columns, axis=1)
+    # continuation bit on every byte except the last of each value
+    data = data | ((np.arange(4) < (lengths[:, None] - 1))*0x80)
+    return data.astype(np.uint8), lengths
+
 def accuracyOfClicks(observed:list, expected:list, num_silent_bars=0):
     
     # define standard deviation of click accuracy
@@ -186,18 +304,24 @@ def tempo2cc(tempo):
     return cc
 
 def stochasticDrummer(tempoInit=120, stdDev_TEMPO=0, stdDev_ERROR=0, pattern_KICK=[], pattern_SNARE=[], prob=[], \
-    Nb = 4, beatDiv=2, NumBars=32, syncBeats=True, seperateFiles=False):
+    Nb = 4, beatDiv=2, NumBars=32, syncBeats=True, seperateFiles=False, seed=None):
     '''
     Returns mido MidiFiles of step-sequenced drums playing the specified pattern.
     At each subbeat step (e.g. eighth note), onset error is added at the specified std. deviation (stdDev_ERROR)
     At each beat step (e.g. quarter note), tempo error is added at the specifed std. deviation (stdDev_TEMPO)
 
+    The tempo walk, onset times and step probabilities of the whole
+    performance are calculated as arrays and the onset track is put in order
+    with a single stable sort, so long test sets are quick to generate.
+
     Parameters
     ----------
 
     tempoInit: tempo in BPM.
     stdDev_TEMPO: std. deviation of beat interval change in ms.
     stdDev_ERROR: std. deviation of error in onset time in ms.
+    seed: seed (or numpy Generator) for the random numbers. If None, numpy's
+        global random state is used (so np.random.seed still applies).
     '''
 
     # MIDI note numbers
@@ -212,10 +336,14 @@ def stochasticDrummer(tempoInit=120, stdDev_TEMPO=0, stdDev_ERROR=0, pattern_KIC
     IBI = 60/tempoInit  # Inter-beat interval in seconds
     tempo = bpm2tempo(tempoInit)  # tempo in microseconds per beat
     note_off_time = int(round(ticks_per_beat/(beatDiv*4)))
+    num_beats = Nb*NumBars
+    num_steps = num_beats*beatDiv
+    sync_ticks = Nb*ticks_per_beat*int(syncBeats)   # ticks taken by the sync beats
 
     # generate noise arrays
-    IBI_noise = np.random.normal(0, stdDev_TEMPO/1000, NumBars*Nb)  # beat interval change at each beat in seconds
-    onset_error = np.random.normal(0, stdDev_ERROR/1000, NumBars*Nb*beatDiv)  # onset errors at each sub beat in seconds
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    IBI_noise = rng.normal(0, stdDev_TEMPO/1000, num_beats)  # beat interval change at each beat in seconds
+    onset_error = rng.normal(0, stdDev_ERROR/1000, num_steps)  # onset errors at each sub beat in seconds
 
     if not pattern_KICK:    # if no kick pattern provided, use the default
         pattern_KICK = [1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 0, 0]
@@ -267,193 +395,263 @@ def stochasticDrummer(tempoInit=120, stdDev_TEMPO=0, stdDev_ERROR=0, pattern_KIC
             track_o.append(Message('note_off', time=note_off_time, note=kick, velocity=127))
             o_ticks_accum = o_ticks_accum + ticks_per_beat
 
-    # 3. Make an array of tempo change times (and tempos)
-        # at the same time, produce the perceptual beat track
-    array_o = []
-    for bp in range(0, Nb*NumBars): # loop through beats in whole performance
-        # Add Tempo Noise ---------------------------------------------------------------------
-        # 1. Adjust the current IBI by a noise amount
-        IBI = IBI + IBI_noise[bp]
-        # 2. Calculate the new tempo in microseconds per beat
-        new_tempo = bpm2tempo(60/IBI)
-        # -------------------------------------------------------------------------------------
-
-        # PERCEPTUAL BEAT TRACK ---------------------------------------------------------------
-
-        # 1. Calculate time in ticks from start of file to this perceptual beat
-        p_ticks_since_start = Nb*ticks_per_beat*int(syncBeats) + bp*ticks_per_beat
-
-        # 2. Subtract accumulated ticks
-        p_ticks_since_last_pb = int(round(p_ticks_since_start - p_ticks_accum))
-
-        # 3. Add tempo change and perceptual beat
-        if new_tempo != tempo:  # if tempo has changed, create a new tempo message, otherwise ignore
-            tempo = new_tempo
-            track_p.append(MetaMessage('set_tempo', tempo=tempo, time=p_ticks_since_last_pb))
-            track_p.append(Message('note_on', time=0, note=cb, velocity=127))
-            track_p.append(Message('note_off', time=note_off_time, note=cb, velocity=127))
-            array_o.append((int(round(p_ticks_since_start)), 1, 'set_tempo', tempo))  # key: 0=note_off, 1=tempo, 2=note_on
+    # 3. Tempo random walk. The interval keeps walking through a second pass
+    # of the same noise for the onset track (as the original per-beat loops did).
+    IBI_walk = np.cumsum(np.concatenate(([IBI], IBI_noise, IBI_noise)))[1:]
+    tempos = np.rint(60*1e6/(60/IBI_walk)).astype(np.int64)    # bpm2tempo(60/IBI) of each beat
+    tempos_p = tempos[:num_beats]   # tempo at each perceptual beat
+    tempos_o = tempos[num_beats:]   # tempo used for the onset error of each beat
+
+    # PERCEPTUAL BEAT TRACK ---------------------------------------------------------------
+    # 1. Ticks from start of file to each perceptual beat (and the final one)
+    p_ticks_since_start = sync_ticks + ticks_per_beat*np.arange(num_beats+1)
+    # 2. Each beat follows the note_off of the previous one
+    p_ticks_since_last_pb = p_ticks_since_start - np.concatenate(([p_ticks_accum], p_ticks_since_start[:-1] + note_off_time))
+    # 3. A tempo change comes with each beat where the tempo has changed
+    is_tempo_change = tempos_p != np.concatenate(([tempo], tempos_p[:-1]))
+
+    # (note messages are built from known valid values, so mido's checks are skipped)
+    for ticks, tempo_change, new_tempo in zip(p_ticks_since_last_pb.tolist(), is_tempo_change.tolist(), tempos_p.tolist()):
+        if tempo_change:
+            track_p.append(MetaMessage('set_tempo', tempo=new_tempo, time=ticks))
+            track_p.append(Message('note_on', time=0, note=cb, velocity=127, skip_checks=True))
         else:
-            track_p.append(Message('note_on', time=p_ticks_since_last_pb, note=cb, velocity=127))
-            track_p.append(Message('note_off', time=note_off_time, note=cb, velocity=127))
-
-        # add to accumulated total
-        p_ticks_accum = p_ticks_accum + p_ticks_since_last_pb + note_off_time
-
-        # -------------------------------------------------------------------------------------
-
+            track_p.append(Message('note_on', time=ticks, note=cb, velocity=127, skip_checks=True))
+        track_p.append(Message('note_off', time=note_off_time, note=cb, velocity=127, skip_checks=True))
         # Add final perceptual beat
-        # 1. Calculate time in ticks from start of file to this perceptual beat
-    p_ticks_since_start =  Nb*ticks_per_beat*int(syncBeats) + Nb*NumBars*ticks_per_beat
-        # 2. Subtract accumulated ticks
-    p_ticks_since_last_pb = int(round(p_ticks_since_start - p_ticks_accum))
-        # 3. Add note indicating perceptual beat and add to accumulated total
-    track_p.append(Message('note_on', time=p_ticks_since_last_pb, note=cb, velocity=127))
-    track_p.append(Message('note_off', time=note_off_time, note=cb, velocity=127))
-    p_ticks_accum = p_ticks_accum + p_ticks_since_last_pb + note_off_time
-
-
-
-    # 4. Make an array of step numbers and times in ticks
-    step = 0    # step number (always in range: 1 - [len(pattern_KICK)])
-    tempo = tempoInit  # restore tempo to intial for this run
-    for bp in range(0, Nb*NumBars): # loop through beats in whole performance
-        # Add Tempo Noise ---------------------------------------------------------------------
-        # 1. Adjust the current IBI by a noise amount
-        IBI = IBI + IBI_noise[bp]
-        # 2. Calculate the new tempo in microseconds per beat
-        tempo = bpm2tempo(60/IBI)
-        # -------------------------------------------------------------------------------------
-
-        # ONSET TRACK -------------------------------------------------------------------------
-        for sb in range(0, beatDiv):    # loop through subbeats within beat
-            # 1. Calculate time in ticks from start of file to this step
-            o_ticks_since_start = Nb*ticks_per_beat*int(syncBeats) + bp*ticks_per_beat\
-                 + sb*ticks_per_beat/beatDiv + second2tick(onset_error[bp*beatDiv + sb], ticks_per_beat, tempo)
-            if o_ticks_since_start < 0:   # may occur at first step if error is negative and no sync beats
-                o_ticks_since_start = 0
-            
-            
-            # 2. add time and step number to array_steps
-            if stepShouldPlay(prob[step]):
-                array_o.append((int(round(o_ticks_since_start)), 2, 'note_on', step))
-                array_o.append((int(round(o_ticks_since_start+note_off_time)), 0, 'note_off', step))
-
-            # 3. increment step
-            step = step + 1
-            if step == len(pattern_KICK):   # step count wraps around
-                step = 0
-
-        # -------------------------------------------------------------------------------------
-
-
-    # 5. Finally, sort list of onset messages by time and add to onset track
-    array_o = sorted(array_o,key=itemgetter(1))
-    array_o = sorted(array_o,key=itemgetter(0))  # sort first by time in ticks then by precedence in order: note_off, tempo, note_on
-
-
-    for msg in array_o:
-        # Calculate accumulated total
-        ticks_since_last_msg = msg[0] - o_ticks_accum
-        # Add to accumulated total ticks
-        o_ticks_prev = o_ticks_accum    # in case we need to undo
-        o_ticks_accum = msg[0]
-        if msg[1] == 0: # note_off message
-            step = msg[3]
-            if pattern_KICK[step] and pattern_SNARE[step]:  # True if kick and snare at step
-                track_o.append(Message('note_off', time=ticks_since_last_msg, note=kick, velocity=127))
-                track_o.append(Message('note_off', time=0, note=snare, velocity=127))
-            elif pattern_KICK[step]:   # True if just kick at step
-                track_o.append(Message('note_off', time=ticks_since_last_msg, note=kick, velocity=127))
-            elif pattern_SNARE[step]: # True if just snare at step
-                track_o.append(Message('note_off', time=ticks_since_last_msg, note=snare, velocity=127))
-            else: # otherwise, subtract from cumulative total
-                o_ticks_accum = o_ticks_prev
-        elif msg[1] == 2:   # note_on message
-            step = msg[3]
-            if pattern_KICK[step] and pattern_SNARE[step]:  # True if kick and snare at step
-                track_o.append(Message('note_on', time=ticks_since_last_msg, note=kick, velocity=127))
-                track_o.append(Message('note_on', time=0, note=snare, velocity=127))
-            elif pattern_KICK[step]:   # True if just kick at step
-                track_o.append(Message('note_on', time=ticks_since_last_msg, note=kick, velocity=127))
-            elif pattern_SNARE[step]: # True if just snare at step
-                track_o.append(Message('note_on', time=ticks_since_last_msg, note=snare, velocity=127))
-            else: # otherwise, subtract from cumulative total
-                o_ticks_accum = o_ticks_prev
-        else: # tempo message
-            tempo = msg[3]
-            track_o.append(MetaMessage('set_tempo', tempo=tempo, time=ticks_since_last_msg))
+    track_p.append(Message('note_on', time=int(p_ticks_since_last_pb[-1]), note=cb, velocity=127, skip_checks=True))
+    track_p.append(Message('note_off', time=note_off_time, note=cb, velocity=127, skip_checks=True))
+
+    # ONSET TRACK -------------------------------------------------------------------------
+    # 4. Time in ticks from start of file to each step (bp*beatDiv + sb)
+    i_step = np.arange(num_steps)
+    bp = i_step//beatDiv
+    sb = i_step%beatDiv
+    error_ticks = np.rint(onset_error/(np.repeat(tempos_o, beatDiv)*1e-6/ticks_per_beat))   # second2tick
+    o_ticks_since_start = (sync_ticks + bp*ticks_per_beat) + sb*ticks_per_beat/beatDiv + error_ticks
+    # may be negative at first step if error is negative and no sync beats
+    o_ticks_since_start = np.maximum(o_ticks_since_start, 0)
+
+    # 5. Steps that play (by probability) and have a kick or snare
+    step = i_step%len(pattern_KICK)   # step number (always in range: 0 - [len(pattern_KICK)-1])
+    has_note = (np.array(pattern_KICK) != 0) | (np.array(pattern_SNARE) != 0)
+    plays = (rng.random(num_steps) <= np.array(prob)[step]) & has_note[step]
+    step = step[plays]
+    o_ticks_since_start = o_ticks_since_start[plays]
+
+    # 6. Tempo changes, then a note_on and note_off per step, sorted first by
+    # time in ticks then by precedence: 0=note_off, 1=tempo, 2=note_on
+    # (ties keep this order, as the stable sorts in the original did).
+    n_tempo = np.count_nonzero(is_tempo_change)
+    ticks = np.concatenate((p_ticks_since_start[:-1][is_tempo_change],
+        np.column_stack((np.rint(o_ticks_since_start), np.rint(o_ticks_since_start + note_off_time))).ravel()))
+    precedence = np.concatenate((np.ones(n_tempo, dtype=np.int64), np.tile([2, 0], len(step))))
+    values = np.concatenate((tempos_p[is_tempo_change], np.repeat(step, 2)))
+    order = np.lexsort((precedence, ticks))
+    ticks = ticks[order].astype(np.int64)
+    ticks_since_last_msg = np.diff(ticks, prepend=o_ticks_accum)
+
+    for ticks, kind, value in zip(ticks_since_last_msg.tolist(), precedence[order].tolist(), values[order].tolist()):
+        if kind == 1:   # tempo message
+            track_o.append(MetaMessage('set_tempo', tempo=value, time=ticks))
+            continue
+        msg_type = 'note_on' if kind == 2 else 'note_off'
+        if pattern_KICK[value] and pattern_SNARE[value]:  # True if kick and snare at step
+            track_o.append(Message(msg_type, time=ticks, note=kick, velocity=127, skip_checks=True))
+            track_o.append(Message(msg_type, time=0, note=snare, velocity=127, skip_checks=True))
+        elif pattern_KICK[value]:   # True if just kick at step
+            track_o.append(Message(msg_type, time=ticks, note=kick, velocity=127, skip_checks=True))
+        else:   # just snare at step
+            track_o.append(Message(msg_type, time=ticks, note=snare, velocity=127, skip_checks=True))
 
     if seperateFiles:
         return onsets, p_beats
     else:
         return midi
 
-def stepShouldPlay(stepProbability):
+def stochasticDrummerStream(tempoInit=120, stdDev_TEMPO=0, stdDev_ERROR=0, pattern_KICK=[], pattern_SNARE=[], prob=[], \
+    Nb=4, beatDiv=2, NumBars=None, syncBeats=True, drop=0, fill=0, tempo_MIN=40, tempo_MAX=300, seed=None):
     '''
-    Returns true if a random number is less than or equal to the step probability
+    Streaming version of stochasticDrummer. Yields the onsets and perceptual
+    beats of a step-sequenced drummer one at a time, in time order, without
+    building a MidiTrack. Plays forever if NumBars is None.
 
-    Copied from a MainStage/Logic scripter script.
+    At each subbeat step, onset error is added at the specified std. deviation (stdDev_ERROR)
+    At each beat step, tempo drift is added at the specified std. deviation (stdDev_TEMPO)
 
     Parameters
     ----------
-    stepProbability: a probability in range 0-1
+    tempoInit: tempo in BPM.
+    stdDev_TEMPO: std. deviation of beat interval change in ms.
+    stdDev_ERROR: std. deviation of error in onset time in ms (limited to
+        half a subbeat, so onsets stay in order).
+    drop: probability of a step that should play being dropped.
+    fill: probability of a bar (after the sync beats) being a fill, with a
+        snare on every subbeat.
+    tempo_MIN, tempo_MAX: tempo drift is kept within this range (BPM).
+    seed: seed of the random number generator.
+
+    Yields
+    ------
+    (t, 'onset', note) for each drum onset, and (t, 'beat', BP) for each
+    perceptual beat, where t is in seconds and BP counts from 1 at the first beat.
     '''
 
-    randomNumber = random.random()
-
-    if(randomNumber <= stepProbability):
-       return True
-    else:
-       return False
+    # MIDI note numbers
+    kick = 36
+    snare = 38
 
+    if not pattern_KICK:    # if no kick pattern provided, use the default
+        pattern_KICK = [1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 0, 0]
+    if not pattern_SNARE:    # if no snare pattern provided, use the default
+        pattern_SNARE = [0, 0, 1, 0, 0, 0, 1, 1, 0, 0, 1, 0, 0, 0, 1, 1]
+    if not prob:    # if no probability array provided, use the default
+        prob = [1]*len(pattern_KICK)
 
-def midiTrack2OnsetTimes(midi_track, ticks_per_beat=480, tempo=500000):
+    rng = np.random.default_rng(seed)
+    IBI = 60/tempoInit  # Inter-beat interval in seconds
+    t_beat = 0  # time of current beat
+    step = 0    # step number (always in range: 0 - [len(pattern_KICK)-1])
+    pending = []    # heap of events not yet yielded
+
+    bp = 0  # beat index
+    while NumBars is None or bp < Nb*(NumBars + int(syncBeats)):
+        is_sync = syncBeats and bp < Nb
+        if bp%Nb == 0:  # new bar
+            is_fill = (not is_sync) and rng.random() < fill
+
+        # 1. Perceptual beat
+        heapq.heappush(pending, (t_beat, 1, 'beat', bp + 1))
+
+        # 2. Onsets of each subbeat
+        if is_sync:
+            heapq.heappush(pending, (t_beat, 2, 'onset', kick))   # constant tempo beats
+        else:
+            for sb in range(beatDiv):
+                limit = IBI/(2*beatDiv)
+                error = min(max(rng.normal(0, stdDev_ERROR/1000), -limit), limit)
+                t = max(t_beat + sb*IBI/beatDiv + error, 0)
+                if is_fill:
+                    notes = [snare]
+                elif rng.random() <= prob[step] and rng.random() >= drop:
+                    notes = [kick]*pattern_KICK[step] + [snare]*pattern_SNARE[step]
+                else:
+                    notes = []
+                for note in notes:
+                    heapq.heappush(pending, (t, 2, 'onset', note))
+
+                step = step + 1
+                if step == len(pattern_KICK):   # step count wraps around
+                    step = 0
+
+        # 3. Next beat, with tempo drift from the first beat after the sync
+        # beats (as in stochasticDrummer, the beat after the last sync beat
+        # is still at the initial tempo)
+        if not is_sync:
+            IBI = IBI + rng.normal(0, stdDev_TEMPO/1000)
+            IBI = min(max(IBI, 60/tempo_MAX), 60/tempo_MIN)
+        t_beat = t_beat + IBI
+        bp = bp + 1
+
+        # 4. Yield events that no later beat can come before
+        while pending and pending[0][0] < t_beat - IBI/2:
+            t, _, kind, value = heapq.heappop(pending)
+            yield t, kind, value
+
+    while pending:
+        t, _, kind, value = heapq.heappop(pending)
+        yield t, kind, value
+
+def midiTrack2OnsetTimes(midi_track, ticks_per_beat=480, tempo=500000, tempo_map=None):
     '''
     Returns a list of onset times in seconds for the given midi track
 
     Onset times are the temporal locations of the beginning of a note (i.e. midi note on messages)
     '''
 
-    times = []
+    times, notes = midiTrack2Onsets(midi_track, ticks_per_beat, tempo, tempo_map)
+    return times
+
+def midiTrack2Onsets(midi_track, ticks_per_beat=480, tempo=500000, tempo_map=None):
+    '''
+    Returns lists of onset times in seconds and the MIDI note number of each
+    onset for the given midi track
+
+    Onset times are the temporal locations of the beginning of a note (i.e. midi note on messages)
+    '''
+
+    times, notes, velocities = midiTrack2NoteOns(midi_track, ticks_per_beat, tempo, tempo_map)
+    return times, notes
+
+def midiTrack2NoteOns(midi_track, ticks_per_beat=480, tempo=500000, tempo_map=None):
+    '''
+    Returns lists of onset times in seconds, MIDI note numbers and velocities
+    of each onset (note_on message) in the given midi track
+
+    Ticks are converted to seconds with tempo_map (a TempoMap, e.g. of the
+    whole file from TempoMap.midiFileTempoMap). If it is None, the set_tempo
+    messages within the track are followed, starting at [tempo].
+    '''
+
+    onset_ticks = []
+    notes = []
+    velocities = []
+    tempo_ticks = []
+    tempos = []
     ticks_since_start = 0
 
     for msg in midi_track:
-        if not msg.type=='channel_prefix' and msg.time != 0:
-            ticks_since_start = ticks_since_start + msg.time # time since start in ticks
+        ticks_since_start = ticks_since_start + msg.time # time since start in ticks
         
         if msg.type=='set_tempo':
-            tempo = msg.tempo
+            tempo_ticks.append(ticks_since_start)
+            tempos.append(msg.tempo)
         elif msg.type=='note_on' and msg.velocity != 0:
-            time_in_seconds = tick2second(ticks_since_start, ticks_per_beat, tempo)
-            times.append(time_in_seconds)
+            onset_ticks.append(ticks_since_start)
+            notes.append(msg.note)
+            velocities.append(msg.velocity)
 
-    return times
+    if tempo_map is None:
+        tempo_map = TempoMap(tempo_ticks, tempos, ticks_per_beat, tempo)
+    times = tempo_map.seconds(np.array(onset_ticks, dtype=np.int64))
+
+    return times.tolist(), notes, velocities
 
-def pbeFromOnsets(onsets_track, ticks_per_beat=480, BP_window=4, Nb=4, beat_div=2, delta_latency=0.025):
+def trackInfo(track_name):
+    '''
+    Returns the information about a test performance stored in the name of its
+    track, e.g. 'rock, Nb=4, beat_div=2'.
+
+    Returns
+    -------
+    patternName, Nb, beat_div
+    '''
+    info = track_name.split(',')
+    patternName = info[0]
+    Nb = int(info[1][info[1].index('=')+1:])
+    beat_div = int(info[2][info[2].index('=')+1:])
+    return patternName, Nb, beat_div
+
+def pbeFromOnsets(onsets_track, ticks_per_beat=480, BP_window=4, Nb=4, beat_div=2, delta_latency=0.025, tempo_map=None):
     '''
     Iterates through each message in the midi track 'onsets_track' and sends eacb onset (note_on message) to a PBE object.
+    (The Perceptual Beat Estimator is now the InputBeatDetector.)
 
     Returns
     -------
     A PBE object, after the onsets have been recorded.
     '''
 
-    pbe = PerceptualBeatEstimator(BP_window=BP_window, Nb=Nb, beat_div=beat_div)
+    # imported here so that loading midi_utils does not load the detectors
+    from InputBeatDetector import InputBeatDetector
 
-    tempo = 500000
-    ticks_since_start = 0
-    for msg in onsets_track:
-        if not msg.is_meta and msg.time != 0:
-            ticks_since_start = ticks_since_start + msg.time
-            
-        if msg.type=='note_on' and msg.velocity != 0:   # velocity of 0 indicates a note_off
-            time_in_seconds = tick2second(ticks_since_start, ticks_per_beat, tempo)
-            time_in_seconds = time_in_seconds - delta_latency
-            pbe.onset(time_in_seconds, note=msg.note)
-
-        elif msg.type=='set_tempo':
-            tempo = msg.tempo
+    pbe = InputBeatDetector(BP_window=BP_window, Nb=Nb, beat_div=beat_div)
+
+    times, notes = midiTrack2Onsets(onsets_track, ticks_per_beat, tempo_map=tempo_map)
+    times = np.array(times) - delta_latency
+
+    # send every onset to the PBE at once (same result as one onset() call per onset)
+    pbe.onsets(times, notes)
     
     return pbe
 
@@ -0,0 +1,119 @@
+'''
+Onset cache - onset times of MIDI test sets, parsed once and stored as
+numpy arrays.
+
+Parsing a test set walks every event of every track. The note_on
+messages of each file are instead converted once into columns of onset
+times, notes and velocities, saved next to the file in __cache__/, and
+loaded from there by later evaluations.
+
+The cache file name holds a hash of the MIDI file and CACHE_VERSION, so a
+cache is rebuilt automatically whenever the file (or the cache format) changes.
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import hashlib
+import numpy as np
+
+CACHE_VERSION = 2   # increment when the contents of the cache change
+
+def fileHash(path):
+    '''
+    Returns the SHA-1 hash (hex string) of the contents of the file at path
+    '''
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def cachePath(path, file_hash):
+    '''
+    Returns the path of the cache of the MIDI file at path with the given hash
+    '''
+    directory, name = os.path.split(path)
+    return os.path.join(directory, '__cache__', f'{name}.{file_hash[:16]}.v{CACHE_VERSION}.npz')
+
+def buildOnsetIndex(path):
+    '''
+    Parses the MIDI file at path (see smf_reader.readSmf()).
+
+    Returns
+    -------
+    A dict of arrays:
+        times, notes, velocities: the onsets of every track, one after the other.
+        track_start: onsets of track i are times[track_start[i]:track_start[i+1]].
+        names: name of each track.
+        patterns, Nb, beat_div: test information from each track name
+            ('pattern, Nb=4, beat_div=2'). '' and -1 where the name has none.
+    '''
+    # only needed when the cache is built
+    from smf_reader import readSmf
+    from midi_utils import trackInfo
+
+    midi = readSmf(path)
+
+    patterns = []
+    Nbs = []
+    beat_divs = []
+    for name in midi['names']:
+        try:
+            patternName, Nb, beat_div = trackInfo(name)
+        except (IndexError, ValueError):   # track name holds no test information
+            patternName, Nb, beat_div = '', -1, -1
+        patterns.append(patternName)
+        Nbs.append(Nb)
+        beat_divs.append(beat_div)
+
+    return {
+        'times': midi['times'],
+        'notes': midi['notes'],
+        'velocities': midi['velocities'],
+        'track_start': midi['track_start'],
+        'names': np.array(midi['names'], dtype=str),
+        'patterns': np.array(patterns, dtype=str),
+        'Nb': np.array(Nbs, dtype=np.int64),
+        'beat_div': np.array(beat_divs, dtype=np.int64),
+    }
+
+def loadOnsetIndex(path):
+    '''
+    Returns the onset index (see buildOnsetIndex()) of the MIDI file at path,
+    from its cache if the cache is up to date. Otherwise the file is parsed
+    and the cache is (re)written.
+    '''
+    file_hash = fileHash(path)
+    cache = cachePath(path, file_hash)
+
+    if os.path.exists(cache):
+        with np.load(cache) as data:
+            return {name: data[name] for name in data.files}
+
+    index = buildOnsetIndex(path)
+
+    # save, then remove caches of older versions of the file. Another
+    # process may be writing (or removing) caches of the same file, so its
+    # temporary files are left alone and files already removed are ignored.
+    directory = os.path.dirname(cache)
+    os.makedirs(directory, exist_ok=True)
+    temp = cache[:-len('.npz')] + f'.{os.getpid()}.tmp.npz'
+    np.savez(temp, **index)
+    os.replace(temp, cache)    # readers never see a partly written cache
+
+    prefix = os.path.basename(path) + '.'
+    for name in os.listdir(directory):
+        if (name.startswith(prefix) and name.endswith('.npz') and not name.endswith('.tmp.npz')
+                and name != os.path.basename(cache)):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+    return index
+
+def trackOnsets(index, i):
+    '''
+    Returns arrays of the onset times, notes and velocities of track i of an onset index
+    '''
+    start, end = index['track_start'][i], index['track_start'][i+1]
+    return index['times'][start:end], index['notes'][start:end], index['velocities'][start:end]
@@ -0,0 +1,211 @@
+'''
+Test report utilities - statistics, plots and spreadsheets produced at the
+end of each BeatSync test.
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import numpy as np
+
+# column names of test results spreadsheet
+RESULTS_COLUMNS = ['Beat Division','Bar Length [beats]','Test Length [beats]', 'Mean Tempo [bpm]', 'RMS Error [ms]', 'Mean Error [ms]','Median Error [ms]',
+    'IBD RMS Error [ms]','IBD Mean Error [ms]', 'IBD Median Error [ms]',
+    'Controller RMS Error [beats]','Controller Mean Error [ms]','Controller Median Error [ms]']
+
+def pyplot():
+    '''
+    Returns matplotlib.pyplot, set up to save figures in latex font.
+
+    matplotlib is only imported the first time a plot is made, so the
+    statistics in this module can be used without it.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')   # figures are only saved to file
+    import matplotlib.pyplot as plt
+    # Change matplotlib font to latex font
+    plt.rcParams.update({
+        "text.usetex": True,
+        "font.family": "serif",
+        "font.serif": ["Computer Modern Roman"],
+    })
+    return plt
+
+def beatTimeErrors(t_mb, t_pb, mb_start=0):
+    '''
+    Returns an array of errors in seconds between machine beat times t_mb
+    and perceptual beat (ground truth) times t_pb.
+    t_mb[0] is machine beat [mb_start] of the test (not 0 if the oldest beat
+    times were dropped from the MBD's history), and is compared with
+    t_pb[mb_start]. The longer of the two lists is trimmed to the length of
+    the other.
+    '''
+    t_pb = t_pb[mb_start:]
+    min_length = min(len(t_pb),len(t_mb))
+    t_mb = np.array(t_mb[0:min_length])
+    t_pb = np.array(t_pb[0:min_length])
+    return t_mb-t_pb     # error in seconds
+
+def predictionErrors(t_next_beat, bp_next_beat, t_pb, Nb):
+    '''
+    Returns an array of errors in seconds between the time of the next beat
+    predicted by the IBD at each onset and the perceptual beat time t_pb.
+
+    The first perceptual beat recorded is at BP = Nb + 1 (after the bar of
+    synchronising beats).
+    '''
+    onset_errors = []  # list of error in prediction time at each onset (IN SECONDS)
+    for i in range(0, len(bp_next_beat)):
+        if bp_next_beat[i] <= Nb:
+            continue
+        if bp_next_beat[i] - Nb > len(t_pb):
+            break
+        bp_next = bp_next_beat[i] - Nb
+        error = t_next_beat[i] - t_pb[bp_next-1]
+        onset_errors.append(error)
+    return np.array(onset_errors)
+
+def errorStats(errors, scale=1):
+    '''
+    Returns the RMS, mean absolute and median absolute error of errors
+    (each multiplied by scale).
+    '''
+    return (np.sqrt(np.mean((scale*errors)**2)),
+        scale*np.mean(abs(errors)),
+        scale*np.median(abs(errors)))
+
+def plotErrors(values, titles, xlabel, ylabel, color, ylim, filenames):
+    '''
+    Saves two plots of values to pdf. The first has the fixed y axis limits
+    ylim, the second has symmetric limits scaled to fit the values.
+
+    titles and filenames are pairs (fixed, scaled).
+    '''
+    plt = pyplot()
+
+    f1 = plt.figure(figsize=(6.4,2.4))
+    plt.title(titles[0])
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.plot(values, color=color, linewidth=1)
+    plt.ylim(ylim)
+    ax = plt.gca()
+    ax.grid(False)
+
+    f2 = plt.figure(figsize=(6.4,2.4))
+    plt.title(titles[1])
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.plot(values, color=color, linewidth=1)
+    ax = plt.gca()
+    yabs_max = abs(max(ax.get_ylim(), key=abs))
+    ax.set_ylim(ymin=-yabs_max, ymax=yabs_max)
+    ax.grid(False)
+
+        # save figures to pdf
+    f1.savefig(filenames[0], bbox_inches='tight')
+    f2.savefig(filenames[1], bbox_inches='tight')
+    plt.close(f1)
+    plt.close(f2)
+
+def trackStats(Nb, beat_div, t_pb, t_mb, t_next_beat, bp_next_beat, controller_errors, mb_start=0):
+    '''
+    Calculates the error statistics of one test (track). mb_start is the
+    index of the machine beat t_mb[0] (see beatTimeErrors).
+
+    Returns
+    -------
+    row: a row of the test results spreadsheet (see RESULTS_COLUMNS).
+    errors: errors in machine beat times [s]
+    onset_errors: errors in the IBD's next beat predictions [s]
+    controller_errors: BP errors at each controller sample [beats]
+    '''
+    # 1. WHOLE SYSTEM STATS
+    #    ------------------
+    # 1.1 Calculate Errors between machine beat times and perceptual beat times
+    errors = beatTimeErrors(t_mb, t_pb, mb_start)
+    t_pb_test = np.array(t_pb[mb_start:mb_start+len(errors)])
+    # 1.2 Record
+    row = [beat_div, Nb, len(errors), 60*(len(t_pb_test)-1)/(t_pb_test[-1]-t_pb_test[0])]
+    row.extend(errorStats(errors, 1000))
+
+    # 2. IBD STATS
+    #    ------------------
+    # 2.1 Calculate errors in predictions made at each onset
+    onset_errors = predictionErrors(t_next_beat, bp_next_beat, t_pb, Nb)
+    # 2.2 Record
+    row.extend(errorStats(onset_errors, 1000))
+
+    # 3. CONTROLLER STATS
+    #    ----------------
+    controller_errors = np.array(controller_errors)
+    # 3.1 Record
+    row.extend(errorStats(controller_errors))
+
+    return row, errors, onset_errors, controller_errors
+
+def trackReport(test_dir, test_num, Nb, beat_div, t_pb, t_mb, t_next_beat, bp_next_beat, controller_errors, latencies=None, mb_start=0):
+    '''
+    Calculates the error statistics of one test (track), and saves error
+    plots and error arrays to test_dir. If latencies (control path timings
+    from a LatencyProfiler) are given, they are saved too. mb_start is the
+    index of the machine beat t_mb[0] (see beatTimeErrors).
+
+    Returns
+    -------
+    A row of the test results spreadsheet (see RESULTS_COLUMNS).
+    '''
+    prefix = test_dir + f'TRACK_{test_num}__'
+    row, errors, onset_errors, controller_errors = trackStats(Nb, beat_div, t_pb, t_mb,
+        t_next_beat, bp_next_beat, controller_errors, mb_start)
+
+    # 1. WHOLE SYSTEM
+    # 1.1 Plot
+    plotErrors(errors*1000,
+        (f'Track {test_num}: MainStage Beat Time Error vs Beat Position', f'Test {test_num}: MainStage Beat Time Error vs Beat Position'),
+        r'Beat Position $\theta_i$ \small{[beats]}', r'Error \small{[ms]}', 'midnightblue', [-100, 100],
+        (prefix + "error_v_bp_fixed.pdf", prefix + "error_v_bp.pdf"))
+    # 1.2 Print array to text file
+    with open(prefix + 'errors.txt', 'w') as textfile:
+        textfile.write(str(errors))
+
+    # 2. IBD
+    # 2.1 Plot
+    plotErrors(onset_errors*1000,
+        (f'Track {test_num}: IBD Predicted Beat Time Error vs Onset Index',)*2,
+        r'Onset Index', r'Error \small{[ms]}', 'darkslategray', [-100, 100],
+        (prefix + "IBD_error_fixed.pdf", prefix + "IBD_error.pdf"))
+    # 2.2 Print array to text file
+    with open(prefix + 'IBD_errors.txt', 'w') as textfile:
+        textfile.write(str(onset_errors))
+
+    # 3. CONTROLLER
+    # 3.1 Plot
+    plotErrors(controller_errors,
+        (f'Track {test_num}: Controller Beat Position Error vs Tempo Change Index',)*2,
+        r'Tempo Change Index', r'Beat Position Error \small{[beats]}', 'purple', [-3, 3],
+        (prefix + "controller_error_fixed.pdf", prefix + "controller_error.pdf"))
+    # 3.2 Print array to text file
+    with open(prefix + 'controller_errors.txt', 'w') as textfile:
+        textfile.write(str(controller_errors))
+
+    # 4. CONTROL PATH LATENCY
+    if latencies is not None:
+        from LatencyProfiler import latencyReport
+        latencyReport(latencies, prefix)
+
+    return row
+
+def resultsTable(rows):
+    '''
+    Returns a pandas DataFrame of the results of every test (rows returned by trackStats)
+    '''
+    import pandas as pd
+    return pd.DataFrame(rows, columns=RESULTS_COLUMNS)
+
+def writeResults(rows, test_dir):
+    '''
+    Saves the results of every test (rows returned by trackReport) into an excel file
+    '''
+    df = resultsTable(rows)
+    df.to_excel(test_dir + 'test_results.xlsx', index=False)
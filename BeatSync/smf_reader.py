@@ -0,0 +1,173 @@
+'''
+SMF reader - reads the onsets of a Standard MIDI File straight from its bytes
+
+mido makes a Python object for every message in a file. The test sets only
+need the note_on, set_tempo and track name events, so these are decoded
+straight from the (memory mapped) file into numpy arrays, and every other
+event is skipped over.
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import mmap
+import struct
+import numpy as np
+from TempoMap import TempoMap
+
+def readSmf(source):
+    '''
+    Reads the note_on events (with a velocity > 0) of every track of a MIDI
+    file.
+
+    Times are converted to seconds with the tempo map of the file: the
+    set_tempo events of all tracks (as a sequencer plays a type 0 or 1 file),
+    or of each track itself in a type 2 file.
+
+    Parameters
+    ----------
+    source: path of a MIDI file (memory mapped), or its bytes.
+
+    Returns
+    -------
+    A dict of:
+        times, notes, velocities: arrays of the onsets of every track, one after the other.
+        ticks: array of the time of each onset in ticks.
+        track_start: onsets of track i are times[track_start[i]:track_start[i+1]].
+        names: list of the name of each track ('' if it has none).
+        ticks_per_beat: resolution of the file.
+        tempo_ticks, tempos: time [ticks] and value [us per beat] of each set_tempo event.
+        tempo_track_start: tempo events of track i (in a type 2 file) are
+            tempo_ticks[tempo_track_start[i]:tempo_track_start[i+1]].
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _readSmfData(bytes(source))
+
+    with open(source, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _readSmfData(data)
+
+def _readSmfData(data):
+    '''
+    Reads the bytes (or mmap) of a MIDI file. See readSmf().
+    '''
+    # 1. Header chunk
+    if data[0:4] != b'MThd':
+        raise ValueError('not a MIDI file (no MThd chunk)')
+    header_length, file_type, num_tracks, division = struct.unpack('>LhhH', data[4:14])
+    if division & 0x8000:
+        raise ValueError('SMPTE time division is not supported')
+    ticks_per_beat = division
+
+    # 2. Track chunks
+    pos = 8 + header_length
+    ticks = []
+    notes = []
+    velocities = []
+    track_start = [0]
+    tempo_ticks = []
+    tempos = []
+    tempo_track_start = [0]
+    names = []
+    while len(names) < num_tracks and pos + 8 <= len(data):
+        chunk_type = data[pos:pos+4]
+        chunk_length = struct.unpack('>L', data[pos+4:pos+8])[0]
+        pos = pos + 8
+        if chunk_type == b'MTrk':
+            names.append(_readTrack(data, pos, pos + chunk_length, ticks, notes, velocities, tempo_ticks, tempos))
+            track_start.append(len(ticks))
+            tempo_track_start.append(len(tempo_ticks))
+        pos = pos + chunk_length   # (unknown chunks are skipped)
+
+    ticks = np.array(ticks, dtype=np.int64)
+    tempo_ticks = np.array(tempo_ticks, dtype=np.int64)
+    tempos = np.array(tempos, dtype=np.int64)
+    track_start = np.array(track_start, dtype=np.int64)
+    tempo_track_start = np.array(tempo_track_start, dtype=np.int64)
+
+    # 3. Ticks to seconds
+    if file_type == 2:  # each track has its own tempo map
+        times = np.empty(len(ticks))
+        for i in range(len(names)):
+            tempo_slice = slice(tempo_track_start[i], tempo_track_start[i+1])
+            track_slice = slice(track_start[i], track_start[i+1])
+            times[track_slice] = TempoMap(tempo_ticks[tempo_slice], tempos[tempo_slice], ticks_per_beat).seconds(ticks[track_slice])
+    else:
+        times = TempoMap(tempo_ticks, tempos, ticks_per_beat).seconds(ticks)
+
+    return {
+        'times': times,
+        'notes': np.array(notes, dtype=np.uint8),
+        'velocities': np.array(velocities, dtype=np.uint8),
+        'ticks': ticks,
+        'track_start': track_start,
+        'names': names,
+        'ticks_per_beat': ticks_per_beat,
+        'tempo_ticks': tempo_ticks,
+        'tempos': tempos,
+        'tempo_track_start': tempo_track_start,
+    }
+
+def _readTrack(data, pos, end, ticks, notes, velocities, tempo_ticks, tempos):
+    '''
+    Scans the events of the track chunk in data[pos:end], appending the
+    tick, note and velocity of each note_on (velocity > 0), and the tick and
+    tempo of each set_tempo event, to the given lists.
+
+    Returns the name of the track ('' if it has none)
+    '''
+    name = ''
+    tick = 0
+    running_status = 0
+    while pos < end:
+        # 1. Delta time (variable length quantity)
+        byte = data[pos]
+        pos = pos + 1
+        delta = byte & 0x7f
+        while byte & 0x80:
+            byte = data[pos]
+            pos = pos + 1
+            delta = (delta << 7) | (byte & 0x7f)
+        tick = tick + delta
+
+        # 2. Status byte (or running status)
+        status = data[pos]
+        if status & 0x80:
+            pos = pos + 1
+            if status < 0xf0:
+                running_status = status
+        else:
+            status = running_status
+            if status == 0:
+                raise ValueError('running status without a previous status byte')
+
+        # 3. Event
+        kind = status & 0xf0
+        if kind == 0x90:    # note_on
+            if data[pos+1] != 0:    # velocity of 0 indicates a note_off
+                ticks.append(tick)
+                notes.append(data[pos])
+                velocities.append(data[pos+1])
+            pos = pos + 2
+        elif kind == 0xc0 or kind == 0xd0:  # program change, channel pressure
+            pos = pos + 1
+        elif kind != 0xf0:  # other channel messages
+            pos = pos + 2
+        else:
+            if status == 0xff:  # meta event
+                meta_type = data[pos]
+                pos = pos + 1
+            length = 0
+            byte = 0x80
+            while byte & 0x80:
+                byte = data[pos]
+                pos = pos + 1
+                length = (length << 7) | (byte & 0x7f)
+            if status == 0xff and meta_type == 0x51:    # set_tempo
+                tempo_ticks.append(tick)
+                tempos.append((data[pos] << 16) | (data[pos+1] << 8) | data[pos+2])
+            elif status == 0xff and meta_type == 0x03 and not name:   # track_name
+                name = bytes(data[pos:pos+length]).decode('latin1')
+            pos = pos + length  # (sysex data and other meta events are skipped)
+
+    return name
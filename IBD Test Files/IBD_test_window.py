@@ -0,0 +1,89 @@
+'''
+IBD window test - checks that the incremental line of best fit of the
+InputBeatDetector fits the same onsets as scanning back from the newest
+onset, including when the beat position of the onsets goes back
+
+Run from this folder: python IBD_test_window.py
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BeatSync'))
+from InputBeatDetector import InputBeatDetector
+
+def referenceLine(t_ons, BP_ons, W, BP_window):
+    '''
+    Returns the tempo and BP_0 of the line of best fit through the onsets
+    from the newest one more than BP_window below the last onset (or all of
+    them), as the IBD first calculated it.
+    '''
+    i_window = 0
+    for i in range(len(BP_ons)-1, -1, -1):
+        if BP_ons[-1] - BP_ons[i] > BP_window:
+            i_window = i
+            break
+    x = t_ons[i_window:]
+    y = BP_ons[i_window:]
+    w = W[i_window:]
+    if len(x) == 1:
+        return None     # no fit: the IBD keeps its tempo
+    n = sum(w)
+    sum_x = sum(w*x)
+    sum_x_2 = sum(w*x**2)
+    sum_y = sum(w*y)
+    sum_xy = sum(w*x*y)
+    tempo = (n*sum_xy - sum_x*sum_y)/(n*sum_x_2 - sum_x**2)
+    return tempo, (sum_y - tempo*sum_x)/n
+
+def checkWindow(t_ons, notes, BP_window):
+    '''
+    Asserts that the IBD's estimate at every onset is the reference line of
+    best fit through its onsets, and that onsets() gives the same estimates.
+    Returns the number of onsets at a lower BP than the onset before them.
+    '''
+    IBD = InputBeatDetector(BP_window=BP_window)
+    for t, note in zip(t_ons, notes):
+        IBD.onset(float(t), int(note))
+        t_hist, BP_hist = IBD.getOnsets()
+        line = referenceLine(t_hist, BP_hist, IBD.W.view(), BP_window)
+        if line is not None:
+            tempo, BP_0 = line
+            assert np.isclose(IBD.getTempo(), tempo, rtol=1e-9), f'onset {IBD.n}: tempo {IBD.getTempo()} (expected {tempo})'
+            # compare intercepts where the line is, at the last onset
+            BP = IBD.getTempo()*t + IBD.BP_0[-1]
+            assert np.isclose(BP, tempo*t + BP_0, rtol=0, atol=1e-6), f'onset {IBD.n}: BP {BP} (expected {tempo*t + BP_0})'
+
+    IBD_batch = InputBeatDetector(BP_window=BP_window)
+    split = len(t_ons)//3
+    IBD_batch.onsets(t_ons[:split], notes[:split])
+    IBD_batch.onsets(t_ons[split:], notes[split:])
+    assert np.array_equal(IBD_batch.getOnsets()[1], IBD.getOnsets()[1]), 'onsets() quantised differently to onset()'
+    assert np.array_equal(IBD_batch.getEstimates()[0], IBD.getEstimates()[0]), 'onsets() estimated a different tempo to onset()'
+
+    return np.count_nonzero(np.diff(IBD.getOnsets()[1]) < 0)
+
+
+# 1. A flam after a gap: the onset at 6.581 s goes back to BP 13, so the
+# onset at 4.194 s (BP 8.5) is back in the window of the next onset
+t_ons = np.array([0.911, 1.384, 2.473, 3.304, 3.454, 4.168, 4.194, 4.829, 5.403, 5.538, 6.518, 6.581, 7.585, 7.637])
+notes = np.array([42, 36, 36, 36, 36, 36, 36, 36, 36, 38, 38, 38, 38, 42])
+assert checkWindow(t_ons, notes, 3) == 1
+
+# 2. Random performances of sub beats with flams and sloppy timing
+np.random.seed(2020)
+descents = 0
+for i in range(300):
+    N = np.random.randint(5, 120)
+    tempo = np.random.uniform(1.2, 3)   # [bps]
+    t_ons = np.cumsum(np.random.choice([0.5, 1, 1.5, 2], N))/tempo
+    t_ons = np.sort(t_ons + np.random.normal(0, np.random.choice([0.02, 0.1, 0.25]), N))
+    notes = np.random.choice([36, 38, 42], N)
+    descents = descents + checkWindow(t_ons, notes, np.random.choice([2, 3, 5]))
+
+assert descents > 0, 'no onset went back in beat position: the test does not cover it'
+print(f'IBD window test passed ({descents} onsets went back in beat position)')
@@ -0,0 +1,56 @@
+'''
+MHBD sync test - checks that the MultiHypothesisBeatDetector follows the
+InputBeatDetector when a performance starts with a bar of sync beats
+
+Run from this folder: python MHBD_test_sync.py
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BeatSync'))
+from InputBeatDetector import InputBeatDetector
+from MultiHypothesisBeatDetector import MultiHypothesisBeatDetector
+from midi_utils import stochasticDrummer, midiTrack2Onsets
+
+def checkSameEstimates(t_ons, notes, BP_window=5, **MHBD_params):
+    '''
+    Asserts that both detectors give the same beat positions and tempos at
+    every onset (from the second onset, where the hypotheses branch).
+    '''
+    IBD = InputBeatDetector(BP_window=BP_window)
+    MHBD = MultiHypothesisBeatDetector(BP_window=BP_window, **MHBD_params)
+    for t, note in zip(t_ons, notes):
+        IBD.onset(float(t), int(note))
+        MHBD.onset(float(t), int(note))
+        assert IBD.getBeatPositionOfLastOnset() == MHBD.getBeatPositionOfLastOnset(), \
+            f'onset {MHBD.n}: BP {MHBD.getBeatPositionOfLastOnset()} (IBD {IBD.getBeatPositionOfLastOnset()})'
+        assert IBD.getTempo() == MHBD.getTempo(), f'onset {MHBD.n}: tempo {MHBD.getTempo()} (IBD {IBD.getTempo()})'
+
+
+# 1. A bar of sync beats at 120 BPM
+checkSameEstimates([0, 0.5, 1, 1.5], [36]*4)
+
+# 2. A metronome, with beams narrower than the number of first onset phases
+for beam_width in [1, 2, 4, 16]:
+    checkSameEstimates(1 + 0.5*np.arange(40), [36]*40, beam_width=beam_width)
+
+# 3. Performances of the stochastic drummer starting with a bar of sync beats
+np.random.seed(2020)
+for i in range(60):
+    onsets, _ = stochasticDrummer(tempoInit=[80, 110, 140][i%3], stdDev_TEMPO=1, stdDev_ERROR=10,
+        NumBars=24, syncBeats=True, seperateFiles=True)
+    t_ons, notes = midiTrack2Onsets(onsets.tracks[0], onsets.ticks_per_beat)
+    checkSameEstimates(t_ons, notes)
+
+# 4. A flam after a gap (see IBD_test_window.py): the BP goes back from 13.5
+# to 13 at the onset at 6.581 s, so the window must be refitted
+t_ons = [0.911, 1.384, 2.473, 3.304, 3.454, 4.168, 4.194, 4.829, 5.403, 5.538, 6.518, 6.581, 7.585, 7.637]
+notes = [42, 36, 36, 36, 36, 36, 36, 36, 36, 38, 38, 38, 38, 42]
+checkSameEstimates(t_ons, notes, BP_window=3, beam_width=1)
+
+print('MHBD sync test passed')
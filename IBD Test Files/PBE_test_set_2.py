@@ -1,7 +1,7 @@
-from midi_utils import midi2string
+from midi_utils import writeMidi
 from mido import MidiFile
 
 pb = MidiFile('test_sets/set_2/onsets.mid')
 
 with open('test_sets/set_2/onsets.txt', "w") as text:
-    text.write(midi2string(pb))
\ No newline at end of file
+    writeMidi(pb, text)
\ No newline at end of file
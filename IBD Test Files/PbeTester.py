@@ -1,7 +1,15 @@
-from midi_utils import midi2string, tick2second
-from PerceptualBeatEstimator import PerceptualBeatEstimator
+import os
+import sys
+# BeatSync modules are imported from the BeatSync folder (also by the spawned workers)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BeatSync'))
+from midi_utils import trackInfo
+from TempoMap import tracksTempoMap, trackTicks, midiFileTempoMap
+from InputBeatDetector import InputBeatDetector
 from mido import MidiFile
 import numpy as np
+import io
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 
 
 class PbeTester:
@@ -9,10 +17,17 @@ class PbeTester:
     A PbeTester object iterates over each message in a given midi track of onsets
     '''
 
-    def __init__(self, track, ticks_per_beat=480, BP_window=4, delta_latency=0):
+    def __init__(self, track, ticks_per_beat=480, BP_window=4, delta_latency=0, report=None, tempo_map=None):
         '''
-        Creates a new PerceptualBeatEstimator object with the given parameters
+        Creates a new PBE (InputBeatDetector) with the given parameters
         and iterates over all the messages in the given track.
+
+        The test info is written to the text stream [report] (e.g. an open
+        file) as each test recording is evaluated. If no stream is given, it
+        is kept in memory and returned by getTestInfo().
+
+        Times follow the tempo changes in tempo_map (a TempoMap of the whole
+        file), or in the track itself if it is None.
         '''
 
         # 1. Extract info about the performance stored in the track name
@@ -21,69 +36,22 @@ class PbeTester:
         Nb = int(trackInfo[1][trackInfo[1].index('=')+1:])
         beat_div = int(trackInfo[2][trackInfo[2].index('=')+1:])
 
-        s = f'Track: name={patternName}, Nb={Nb}, beat_div={beat_div}\n'
-        s = s + '------------------------------------------------------------------\n\n'
-
-        # 2. Create new PBE object, initialising with given parameters
-        pbe = PerceptualBeatEstimator(Nb=Nb, beat_div=beat_div, BP_window=BP_window)
+        self.report = io.StringIO() if report is None else report
+        s = self.report
+        s.write(f'Track: name={patternName}, Nb={Nb}, beat_div={beat_div}\n')
+        s.write('------------------------------------------------------------------\n\n')
 
-        # 3. Iterate over each message in midi track
-        num_tests = 0  # counts the number of tests within this file
+        # 2. Split the track into its test recordings and evaluate each one
+        # with a new PBE object, initialised with the given parameters
         self.arr_errors = []  # list of lists of prediction time errors
-        for msg in track:
-            if not msg.is_meta and msg.time != 0:
-                time_since_start = time_since_start + msg.time
-                
-            if msg.type=='note_on' and msg.velocity != 0:   # velocity of 0 indicates a note_off
-                
-                if msg.note == 54:      # => new recording
-                    # create test recording heading
-                    s = s + f'\tTest {num_tests+1}\n\t--------\n'
-                    num_tests = num_tests + 1
-                    # reset all algorithm variables
-                    pb_times = (np.zeros(Nb+1)).tolist()  # stores the times of each perceptual beat
-                    time_since_start = 0    # time since start in ticks
-
-                    # reset the PBE
-                    pbe.reset()
-
-                elif msg.note == 53:    # => end of recording  -> determine the accuracy of the PBE
-                    # get onset times and predictions made
-                    t_ons, BP_ons = pbe.getOnsets()
-                    t_next_beat, bp_next_beat = pbe.getPredictions()
-
-                    # setup variables needed for error calculation
-                    errors = []     # stores errors in seconds between predicted perceptual beat time and recorded pb time.
-
-                    for j in range(1, len(t_ons)):  # loop through recorded onsets. skip the first onset
-                        predicted_time = pb_times[bp_next_beat[j]]
-                        # the first perceptual beat occurs adter the synchronising beats
-                            # E.g. in the case of 4/4, first pb and therefore first comparision is at BP=5.
-                        if predicted_time:    # True if a perceptual beat was recorded at BP = bp_next_beat[j] -> False if 0
-                            errors.append(t_next_beat[j] - predicted_time)
-                            #s = s + f'error = {errors[-1]*1000:<5.2f} ms\n'
-                    self.arr_errors.append(errors)
-
-                    # Calculate error stats and append to string output
-                    s = s + f'\t  * highest error: {errors[np.argmax(np.abs(np.array(errors)))]*1000:<5.4} ms @ t={t_ons[np.argmax(np.abs(np.array(errors)))]:<7.4} s\n'
-                    s = s + f'\t  * standard deviation of errors: {np.std(errors)*1000:<5.4} ms\n'
-                    s = s + f'\t  * abs. mean: {np.mean(np.abs(np.array(errors)))*1000:<5.4} ms\n'
-                    s = s + '\n'
-                        
-                elif msg.note==56:      # => perceptual beat note number
-                    pb_times.append(tick2second(time_since_start, ticks_per_beat, tempo))
-
-                else:   # => onset
-                    
-                    time_in_seconds = tick2second(time_since_start, ticks_per_beat, tempo)
-                    time_in_seconds = time_in_seconds - delta_latency
-                    pbe.onset(time_in_seconds, note=msg.note)
-
-            elif msg.type=='set_tempo':
-                tempo = msg.tempo
+        for i, recording in enumerate(splitRecordings(track, ticks_per_beat, tempo_map)):
+            # create test recording heading
+            s.write(f'\tTest {i+1}\n\t--------\n')
+            if recording['complete']:
+                errors, t_ons = scoreRecording(recording, Nb, beat_div, BP_window, delta_latency)
+                self.arr_errors.append(errors)
+                writeRecordingStats(s, errors, t_ons)
         
-        # store track info
-        self.str_error_info = s
     
     def getErrors(self):
         '''
@@ -107,7 +75,174 @@ class PbeTester:
         '''
         Returns a string containing information about the PBE's performance for each test recording.
 
-        String includes formatted headings.
+        String includes formatted headings. Returns None if the info was
+        written to a report stream given to the constructor.
         '''
 
-        return self.str_error_info
\ No newline at end of file
+        if isinstance(self.report, io.StringIO):
+            return self.report.getvalue()
+        return None
+
+
+def splitRecordings(track, ticks_per_beat=480, tempo_map=None):
+    '''
+    Splits a track into its test recordings. A recording starts at note 54
+    and ends at note 53. Notes 56 are perceptual beats and any other notes
+    are onsets.
+
+    Times follow the tempo changes in tempo_map (a TempoMap of the whole
+    file), or in the track itself if it is None.
+
+    Returns
+    -------
+    A list with a dict for each recording holding the times (from the start
+    of the recording) of its onsets t_ons, their notes, and the times of its
+    perceptual beats t_pb. complete is False if the track ends before the
+    end of the recording.
+    '''
+    # 1. Time in seconds of each message in the track
+    if tempo_map is None:
+        tempo_map = tracksTempoMap([track], ticks_per_beat)
+    msg_times = tempo_map.seconds(trackTicks(track)).tolist()
+
+    # 2. Iterate over each message in midi track
+    recordings = []
+    recording = None
+    for msg, t_msg in zip(track, msg_times):
+        if msg.type=='note_on' and msg.velocity != 0:   # velocity of 0 indicates a note_off
+            if msg.note == 54:      # => new recording
+                recording = {'t_ons': [], 'notes': [], 't_pb': [], 'complete': False}
+                recordings.append(recording)
+                t_start = t_msg    # time of the start of the recording
+            elif recording is None or recording['complete']:
+                continue    # not within a recording
+            elif msg.note == 53:    # => end of recording
+                recording['complete'] = True
+            elif msg.note == 56:    # => perceptual beat note number
+                recording['t_pb'].append(t_msg - t_start)
+            else:   # => onset
+                recording['t_ons'].append(t_msg - t_start)
+                recording['notes'].append(msg.note)
+
+    return recordings
+
+def scoreRecording(recording, Nb, beat_div, BP_window=4, delta_latency=0):
+    '''
+    Sends each onset of a recording (see splitRecordings()) to a new PBE and
+    compares its predictions with the recorded perceptual beats.
+    (The Perceptual Beat Estimator is now the InputBeatDetector.)
+
+    Returns
+    -------
+    errors: list of prediction time errors [s] (predicted - recorded perceptual beat time)
+    t_ons: onset times of the PBE
+    '''
+    pbe = InputBeatDetector(Nb=Nb, beat_div=beat_div, BP_window=BP_window)
+    for t, note in zip(recording['t_ons'], recording['notes']):
+        pbe.onset(t - delta_latency, note=note)
+
+    # get onset times and predictions made
+    t_ons, BP_ons = pbe.getOnsets()
+    t_next_beat, bp_next_beat = pbe.getPredictions()
+
+    # stores the times of each perceptual beat
+    pb_times = (np.zeros(Nb+1)).tolist() + list(recording['t_pb'])
+
+    errors = []     # stores errors in seconds between predicted perceptual beat time and recorded pb time.
+    for j in range(1, len(t_ons)):  # loop through recorded onsets. skip the first onset
+        predicted_time = pb_times[bp_next_beat[j]]
+        # the first perceptual beat occurs adter the synchronising beats
+            # E.g. in the case of 4/4, first pb and therefore first comparision is at BP=5.
+        if predicted_time:    # True if a perceptual beat was recorded at BP = bp_next_beat[j] -> False if 0
+            errors.append(t_next_beat[j] - predicted_time)
+
+    return errors, t_ons
+
+def writeRecordingStats(stream, errors, t_ons):
+    '''
+    Writes the error stats of a recording to a text stream
+    '''
+    i_highest = np.argmax(np.abs(np.array(errors)))
+    stream.write(f'\t  * highest error: {errors[i_highest]*1000:<5.4} ms @ t={t_ons[i_highest]:<7.4} s\n')
+    stream.write(f'\t  * standard deviation of errors: {np.std(errors)*1000:<5.4} ms\n')
+    stream.write(f'\t  * abs. mean: {np.mean(np.abs(np.array(errors)))*1000:<5.4} ms\n')
+    stream.write('\n')
+
+
+def _scoreRecordingJob(job):
+    recording, Nb, beat_div, BP_window, delta_latency = job
+    return scoreRecording(recording, Nb, beat_div, BP_window, delta_latency)
+
+def evaluateTestSet(paths, BP_window=4, delta_latency=0, processes=None, report=None):
+    '''
+    Evaluates the PBE on every recording of every track of the given MIDI
+    files (e.g. all the .mid files of a test set folder).
+
+    The files are split into their recordings first (see splitRecordings()),
+    then the recordings are scored in parallel by a pool of worker processes.
+    Tracks whose name holds no test information (e.g. the tempo track) are
+    skipped, and times follow the tempo map of the whole file.
+    Results are merged in the order of files, tracks and recordings, so they
+    are the same as those of a PbeTester for each track, whatever the number
+    of processes.
+
+    Parameters
+    ----------
+    paths: list of paths of MIDI files.
+    processes: number of worker processes (default: number of CPUs).
+    report: optional text stream to write the test info of every track to,
+        in the same format as PbeTester.
+
+    Returns
+    -------
+    A list with a dict for each track holding its file, track number,
+    pattern, Nb, beat_div, errors (list of lists of prediction time errors
+    of each recording, as PbeTester.getErrors()) and stats (a tuple of
+    (highest error, std. deviation, abs. mean) [s] for each recording).
+    '''
+    # 1. Split every track into its recordings
+    tracks = []
+    jobs = []
+    for path in paths:
+        midi = MidiFile(path)
+        tempo_map = midiFileTempoMap(midi)
+        for i, track in enumerate(midi.tracks):
+            try:
+                patternName, Nb, beat_div = trackInfo(track.name)
+            except (IndexError, ValueError):   # track name holds no test information
+                continue
+
+            recordings = splitRecordings(track, midi.ticks_per_beat, tempo_map)
+            tracks.append({'file': os.path.basename(path), 'track': i, 'pattern': patternName,
+                'Nb': Nb, 'beat_div': beat_div, 'recordings': recordings})
+            jobs.extend((recording, Nb, beat_div, BP_window, delta_latency)
+                for recording in recordings if recording['complete'])
+
+    # 2. Score the recordings in parallel (results come back in job order)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        scores = iter(list(pool.map(_scoreRecordingJob, jobs)))
+
+    # 3. Merge results per track
+    results = []
+    for track in tracks:
+        if report is not None:
+            report.write(f'Track: name={track["pattern"]}, Nb={track["Nb"]}, beat_div={track["beat_div"]}\n')
+            report.write('------------------------------------------------------------------\n\n')
+        errors = []
+        stats = []
+        for i, recording in enumerate(track.pop('recordings')):
+            if report is not None:
+                report.write(f'\tTest {i+1}\n\t--------\n')
+            if recording['complete']:
+                recording_errors, t_ons = next(scores)
+                errors.append(recording_errors)
+                stats.append((float(recording_errors[np.argmax(np.abs(np.array(recording_errors)))]),
+                    float(np.std(recording_errors)), float(np.mean(np.abs(np.array(recording_errors))))))
+                if report is not None:
+                    writeRecordingStats(report, recording_errors, t_ons)
+        track['errors'] = errors
+        track['stats'] = stats
+        results.append(track)
+
+    return results
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Benchmark suite for the BeatSync hot paths
+
+Times InputBeatDetector.onset, MultiHypothesisBeatDetector.onset (at several
+beam widths), MachineBeatDetector.onset, Controller.sample,
+MachineBeatDetector.shiftBeatPosition and the MIDI parsing helpers of
+midi_utils and smf_reader over sessions of realistic length, using reproducible synthetic
+performances.
+
+Per-call p50/p99 latency and throughput are saved as JSON. If a baseline is
+given, any benchmark whose p50 latency is more than [tolerance] slower than
+the baseline is flagged as a regression (and the exit code is 1).
+
+Usage:
+    python benchmark_suite.py                           # run, save results
+    python benchmark_suite.py --baseline baseline.json  # run and compare
+    python benchmark_suite.py --quick --output baseline.json
+
+@author: Ben Adey
+@year: 2020
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BeatSync'))
+from InputBeatDetector import InputBeatDetector
+from MultiHypothesisBeatDetector import MultiHypothesisBeatDetector
+from MachineBeatDetector import MachineBeatDetector
+from Controller import Controller
+import midi_utils
+import onset_cache
+import smf_reader
+
+SESSION_LENGTHS = [100, 1000, 10000, 100000]     # number of onsets
+QUICK_SESSION_LENGTHS = [100, 1000, 10000]
+SEED = 2020
+BEAM_WIDTHS = [4, 16, 64]
+
+
+def performance(n, seed=SEED, tempo=2, beat_div=2):
+    '''
+    Returns arrays of n onset times and notes of a synthetic drummer: sub beats
+    at a slowly drifting tempo (beats per second) with timing noise and some
+    sub beats left out. Starts with one bar of beats.
+    '''
+    rng = np.random.default_rng(seed)
+    ibi = 1/tempo
+    t = 1.0
+    times = []
+    notes = []
+    k = 0
+    while len(times) < n:
+        ibi = ibi + rng.normal(0, 0.0005)
+        for sb in range(beat_div):
+            if (k < 4 and sb == 0) or (k >= 4 and rng.random() > 0.2):
+                times.append(t + sb*ibi/beat_div + rng.normal(0, 0.005))
+                notes.append(36 if sb == 0 and k%2 == 0 else 38)
+        t = t + ibi
+        k = k + 1
+    times = np.sort(np.array(times[:n]))
+    return times, np.array(notes[:n])
+
+def summary(durations, calls_per_duration=1):
+    '''
+    Returns the p50/p99 latency [us] per call and throughput [calls/s] of
+    an array of durations [s] (each covering calls_per_duration calls).
+    '''
+    durations = np.asarray(durations)/calls_per_duration
+    return {
+        'calls': int(len(durations)*calls_per_duration),
+        'p50_us': float(1e6*np.percentile(durations, 50)),
+        'p99_us': float(1e6*np.percentile(durations, 99)),
+        'throughput_per_s': float(1/np.mean(durations)),
+    }
+
+
+# 1. DETECTORS AND CONTROLLER
+#    ------------------------
+
+def benchIBDOnset(n, IBD=None):
+    t_ons, notes = performance(n)
+    IBD = IBD or InputBeatDetector()
+    durations = np.empty(n)
+    for i in range(n):
+        t, note = float(t_ons[i]), int(notes[i])
+        t0 = timer()
+        IBD.onset(t, note=note)
+        durations[i] = timer() - t0
+    return summary(durations)
+
+def benchMHBDOnset(beam_width):
+    # same performance as benchIBDOnset, so the cost of the beam is the
+    # difference between the two
+    return lambda n: benchIBDOnset(n, MultiHypothesisBeatDetector(beam_width=beam_width))
+
+def benchMBDOnset(n):
+    # MainStage clicks at a steady tempo, with a tempo change every 0.2 s (T_tempo)
+    MBD = MachineBeatDetector()
+    durations = np.empty(n)
+    T_click = 0.25
+    t_tempo_NEXT = 0.2
+    BBP = 1
+    for i in range(n):
+        t = 1 + i*T_click
+        while t_tempo_NEXT < t:
+            MBD.tempoChange(t_tempo_NEXT, 1/(2*T_click))
+            t_tempo_NEXT = t_tempo_NEXT + 0.2
+        t0 = timer()
+        MBD.onset(t, BBP)
+        durations[i] = timer() - t0
+        BBP = BBP + 0.5 if BBP < 4.5 else 1
+    return summary(durations)
+
+def benchControllerSample(n):
+    # controller sampled after every input onset, with the machine following
+    t_ons, notes = performance(n)
+    IBD = InputBeatDetector()
+    MBD = MachineBeatDetector()
+    controller = Controller()
+    durations = []
+    BBP = 1
+    for i in range(n):
+        t = float(t_ons[i])
+        IBD.onset(t, note=int(notes[i]))
+        MBD.onset(t, BBP)
+        BBP = BBP + 0.5 if BBP < 4.5 else 1
+        if i < 4:
+            continue
+        t0 = timer()
+        tempo_m_NEW = controller.sample(t + 0.2, IBD, MBD)
+        durations.append(timer() - t0)
+        if tempo_m_NEW != -1:
+            MBD.tempoChange(t + 0.2, tempo_m_NEW)
+    return summary(durations)
+
+def benchShiftBeatPosition(n):
+    # shift cost on a machine that has already been playing for n onsets
+    MBD = MachineBeatDetector()
+    BBP = 1
+    for i in range(n):
+        MBD.onset(1 + i*0.25, BBP)
+        BBP = BBP + 0.5 if BBP < 4.5 else 1
+    durations = np.empty(1000)
+    for i in range(1000):
+        shift = 4 if i%2 == 0 else -4
+        t0 = timer()
+        MBD.shiftBeatPosition(shift)
+        durations[i] = timer() - t0
+    return summary(durations)
+
+
+# 2. MIDI PARSING
+#    ------------
+
+def testSetFile(n, directory):
+    '''
+    Saves a MIDI file with two tracks of n onsets (note on and off) and
+    returns its path.
+    '''
+    from mido import MidiFile, MidiTrack, Message, MetaMessage, second2tick
+    midi = MidiFile(ticks_per_beat=480)
+    midi.tracks.append(MidiTrack([MetaMessage('set_tempo', tempo=500000)]))
+    for k in range(2):
+        t_ons, notes = performance(n, seed=SEED+k)
+        track = MidiTrack()
+        track.name = 'benchmark, Nb=4, beat_div=2'
+        tick_last = 0
+        for t, note in zip(t_ons, notes):
+            tick = int(round(second2tick(t, 480, 500000)))
+            tick = max(tick, tick_last)
+            track.append(Message('note_on', note=int(note), velocity=100, time=tick-tick_last))
+            track.append(Message('note_on', note=int(note), velocity=0, time=0))
+            tick_last = tick
+        midi.tracks.append(track)
+    path = os.path.join(directory, f'onsets_{n}.mid')
+    midi.save(path)
+    return path
+
+def repeatTimed(function, repeats):
+    durations = np.empty(repeats)
+    for i in range(repeats):
+        t0 = timer()
+        function()
+        durations[i] = timer() - t0
+    return durations
+
+def benchMidiParsing(n, directory):
+    from mido import MidiFile
+    path = testSetFile(n, directory)
+    midi = MidiFile(path)
+    track = midi.tracks[1]
+    repeats = max(3, min(50, 100000//n))
+
+    results = {}
+    results['MidiFile'] = summary(repeatTimed(lambda: MidiFile(path), repeats))
+    results['midiTrack2OnsetTimes'] = summary(repeatTimed(lambda: midi_utils.midiTrack2OnsetTimes(track, midi.ticks_per_beat), repeats))
+    results['midiTrack2Onsets'] = summary(repeatTimed(lambda: midi_utils.midiTrack2Onsets(track, midi.ticks_per_beat), repeats))
+    results['midi2times'] = summary(repeatTimed(lambda: midi_utils.midi2times(midi), repeats))
+    results['readSmf'] = summary(repeatTimed(lambda: smf_reader.readSmf(path), repeats))
+    results['pbeFromOnsets'] = summary(repeatTimed(lambda: midi_utils.pbeFromOnsets(track, midi.ticks_per_beat), max(3, repeats//10)))
+    onset_cache.loadOnsetIndex(path)   # build cache
+    results['loadOnsetIndex (cached)'] = summary(repeatTimed(lambda: onset_cache.loadOnsetIndex(path), repeats))
+    return results
+
+
+# 3. SUITE
+#    -----
+
+def runSuite(session_lengths):
+    '''
+    Runs every benchmark at every session length.
+
+    Returns
+    -------
+    A dict of results keyed by '[benchmark] [n=session length]'
+    '''
+    results = {}
+    benchmarks = {
+        'InputBeatDetector.onset': benchIBDOnset,
+        **{f'MultiHypothesisBeatDetector.onset [beam_width={beam_width}]': benchMHBDOnset(beam_width) for beam_width in BEAM_WIDTHS},
+        'MachineBeatDetector.onset': benchMBDOnset,
+        'Controller.sample': benchControllerSample,
+        'MachineBeatDetector.shiftBeatPosition': benchShiftBeatPosition,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for n in session_lengths:
+            for name, benchmark in benchmarks.items():
+                results[f'{name} [n={n}]'] = benchmark(n)
+                print(f'{name} [n={n}]: {results[f"{name} [n={n}]"]["p50_us"]:.2f} us')
+            for name, result in benchMidiParsing(n, directory).items():
+                results[f'midi_utils.{name} [n={n}]'] = result
+                print(f'midi_utils.{name} [n={n}]: {result["p50_us"]:.1f} us')
+    return results
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a list of (name, p50, baseline p50) of the benchmarks whose p50
+    latency is more than [tolerance] (a fraction) slower than the baseline.
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        p50_baseline = baseline[name]['p50_us']
+        if result['p50_us'] > p50_baseline*(1 + tolerance):
+            regressions.append((name, result['p50_us'], p50_baseline))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='BeatSync hot path benchmarks')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to save results to')
+    parser.add_argument('--baseline', help='JSON results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slow down before a regression is flagged')
+    parser.add_argument('--quick', action='store_true', help=f'only session lengths {QUICK_SESSION_LENGTHS}')
+    args = parser.parse_args()
+
+    session_lengths = QUICK_SESSION_LENGTHS if args.quick else SESSION_LENGTHS
+    results = runSuite(session_lengths)
+
+    output = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'session_lengths': session_lengths,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'Results saved to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, p50, p50_baseline in regressions:
+            print(f'REGRESSION {name}: p50 {p50:.2f} us (baseline {p50_baseline:.2f} us)')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()